@@ -0,0 +1,453 @@
+"""
+Local stand-ins for the two backends main.py talks to.
+
+FakeFirestore   in-memory subset of google.cloud.firestore.Client — enough for
+                the queries main.py runs; inject with main.set_db(FakeFirestore())
+FakeWebRisk     HTTP server speaking the Web Risk v1 routes main.py calls
+                (uris:submit, operations get / list) plus an OAuth token
+                endpoint, with configurable latency and error rate
+
+    python bench/fakes.py --port 9090 --latency 80 --error-rate 0.02
+"""
+import argparse
+import copy
+import hashlib
+import itertools
+import json
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+
+# ─────────────────────────  FIRESTORE  ───────────────────────────────────────
+def _now():
+    return datetime.now(timezone.utc)
+
+
+def _resolve(value):
+    """Replace SERVER_TIMESTAMP sentinels the way the server would."""
+    from google.cloud import firestore
+    if value is firestore.SERVER_TIMESTAMP:
+        return _now()
+    if isinstance(value, dict):
+        return {k: _resolve(v) for k, v in value.items()}
+    return value
+
+
+_OPS = {
+    "==":     lambda a, b: a == b,
+    "!=":     lambda a, b: a != b,
+    "<":      lambda a, b: a < b,
+    "<=":     lambda a, b: a <= b,
+    ">":      lambda a, b: a > b,
+    ">=":     lambda a, b: a >= b,
+    "in":     lambda a, b: a in b,
+    "not-in": lambda a, b: a not in b,
+}
+
+
+def _comparable(a, b) -> bool:
+    """Range filters only match values of the same type, like Firestore."""
+    if a is None or b is None:
+        return False
+    numbers = (int, float)
+    return isinstance(a, numbers) and isinstance(b, numbers) or type(a) is type(b)
+
+
+def _field(data: dict | None, field: str):
+    """Value at dotted |field| of |data|, None when missing (for sorting and filters)."""
+    value = data or {}
+    for part in field.split("."):
+        value = value.get(part) if isinstance(value, dict) else None
+    return value
+
+
+class FakeSnapshot:
+    def __init__(self, ref, data):
+        self.reference = ref
+        self.id        = ref.id
+        self.exists    = data is not None
+        self._data     = data
+
+    def to_dict(self):
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+    def get(self, field: str):
+        # like DocumentSnapshot.get(): a missing field is an error, not None
+        if not _has(self._data or {}, field):
+            raise KeyError(f"'{field}' is not contained in the data")
+        return _field(self._data, field)
+
+
+class FakeDocument:
+    def __init__(self, client, collection: str, doc_id: str):
+        self._client, self._coll, self.id = client, collection, doc_id
+
+    @property
+    def _docs(self) -> dict:
+        return self._client._data.setdefault(self._coll, {})
+
+    def get(self, field_paths=None, transaction=None):
+        with self._client._lock:
+            data = copy.deepcopy(self._docs.get(self.id))
+        if data is not None and field_paths is not None:
+            data = {f: data[f] for f in field_paths if f in data}
+        self._client.reads += 1
+        self._client.bytes_read += len(json.dumps(data, default=str))
+        return FakeSnapshot(self, data)
+
+    def set(self, data: dict, merge: bool = False):
+        with self._client._lock:
+            data = _resolve(copy.deepcopy(data))
+            if merge and self.id in self._docs:
+                self._docs[self.id].update(data)
+            else:
+                self._docs[self.id] = data
+        self._client.writes += 1
+
+    def update(self, data: dict):
+        with self._client._lock:
+            if self.id not in self._docs:
+                raise KeyError(f"no document to update: {self._coll}/{self.id}")
+            self._docs[self.id].update(_resolve(copy.deepcopy(data)))
+        self._client.writes += 1
+
+    def delete(self):
+        with self._client._lock:
+            self._docs.pop(self.id, None)
+        self._client.writes += 1
+
+
+class FakeQuery:
+    def __init__(self, client, collection: str, orders=(), filters=(),
+                 limit=None, after=None, fields=None):
+        self._client, self._coll = client, collection
+        self._orders, self._filters = tuple(orders), tuple(filters)
+        self._limit, self._after, self._fields = limit, after, fields
+
+    def _with(self, **changes):
+        state = dict(orders=self._orders, filters=self._filters, limit=self._limit,
+                     after=self._after, fields=self._fields)
+        state.update(changes)
+        return FakeQuery(self._client, self._coll, **state)
+
+    def order_by(self, field: str, direction: str = "ASCENDING"):
+        return self._with(orders=self._orders + ((field, direction),))
+
+    def where(self, field=None, op=None, value=None, *, filter=None):
+        if filter is not None:
+            field, op, value = filter.field_path, filter.op_string, filter.value
+        return self._with(filters=self._filters + ((field, op, value),))
+
+    def limit(self, count: int):
+        return self._with(limit=count)
+
+    def start_after(self, cursor):
+        return self._with(after=cursor)
+
+    def select(self, fields):
+        return self._with(fields=tuple(fields))
+
+    @staticmethod
+    def _value(doc_id, data, field):
+        return doc_id if field == "__name__" else _field(data, field)
+
+    def _matches(self, doc_id, data) -> bool:
+        for field, op, want in self._filters:
+            have = self._value(doc_id, data, field)
+            if op in ("<", "<=", ">", ">="):
+                if not _comparable(have, want) or not _OPS[op](have, want):
+                    return False
+            elif op in ("in", "not-in", "==", "!=") and field != "__name__" \
+                    and not _has(data, field):
+                return False
+            elif not _OPS[op](have, want):
+                return False
+        return True
+
+    def stream(self, transaction=None):
+        with self._client._lock:
+            items = [(k, copy.deepcopy(v))
+                     for k, v in self._client._data.get(self._coll, {}).items()]
+        items = [(k, d) for k, d in items if self._matches(k, d)]
+
+        # order_by excludes docs without the field; __name__ breaks ties
+        orders = list(self._orders)
+        items  = [(k, d) for k, d in items
+                  if all(f == "__name__" or _has(d, f) for f, _ in orders)]
+        if not orders or orders[-1][0] != "__name__":
+            orders.append(("__name__", orders[-1][1] if orders else "ASCENDING"))
+        for field, direction in reversed(orders):
+            items.sort(key=lambda kd: _sort_key(self._value(kd[0], kd[1], field)),
+                       reverse=direction == "DESCENDING")
+
+        if self._after is not None:
+            if isinstance(self._after, FakeSnapshot):
+                after_id, after_data = self._after.id, self._after._data or {}
+            else:
+                after_id, after_data = self._after.get("__name__"), self._after
+            cursor = [_sort_key(self._value(after_id, after_data, f)) for f, _ in orders]
+
+            def past(kd):
+                for (field, direction), c in zip(orders, cursor):
+                    v = _sort_key(self._value(kd[0], kd[1], field))
+                    if v != c:
+                        return v < c if direction == "DESCENDING" else v > c
+                return False
+            items = [kd for kd in items if past(kd)]
+
+        if self._limit is not None:
+            items = items[:self._limit]
+        for doc_id, data in items:
+            if self._fields is not None:
+                data = {f: data[f] for f in self._fields if f in data}
+            self._client.reads += 1
+            self._client.bytes_read += len(json.dumps(data, default=str))
+            yield FakeSnapshot(FakeDocument(self._client, self._coll, doc_id), data)
+
+    def get(self, transaction=None):
+        return list(self.stream())
+
+    def on_snapshot(self, callback):
+        raise NotImplementedError("FakeFirestore has no listen/watch support")
+
+
+def _has(data: dict, field: str) -> bool:
+    for part in field.split("."):
+        if not isinstance(data, dict) or part not in data:
+            return False
+        data = data[part]
+    return True
+
+
+def _sort_key(value):
+    # Firestore orders values by type first; a compact version of that rule
+    if value is None:
+        return (0, 0)
+    if isinstance(value, bool):
+        return (1, value)
+    if isinstance(value, (int, float)):
+        return (2, value)
+    if isinstance(value, datetime):
+        return (3, value.timestamp())
+    return (4, str(value))
+
+
+class FakeCollection(FakeQuery):
+    def __init__(self, client, name: str):
+        super().__init__(client, name)
+        self.id = name
+
+    def document(self, doc_id: str | None = None):
+        return FakeDocument(self._client, self._coll, doc_id or hashlib.sha1(
+            str(time.time_ns()).encode()).hexdigest()[:20])
+
+
+class FakeWriteBatch:
+    def __init__(self, client):
+        self._client, self._writes = client, []
+
+    def set(self, ref, data, merge=False):
+        self._writes.append(lambda: ref.set(data, merge=merge))
+
+    def update(self, ref, data):
+        self._writes.append(lambda: ref.update(data))
+
+    def delete(self, ref):
+        self._writes.append(ref.delete)
+
+    def __len__(self):
+        return len(self._writes)
+
+    def commit(self):
+        if len(self._writes) > 500:
+            raise ValueError("maximum 500 writes allowed per request")
+        with self._client._lock:
+            for write in self._writes:
+                write()
+        self._writes = []
+        return []
+
+
+class FakeTransaction(FakeWriteBatch):
+    """Serialises transactions on the client lock (enough for leases)."""
+    _max_attempts = 5
+    _read_only    = False
+    _id           = None
+
+    def __init__(self, client):
+        super().__init__(client)
+        self._held = False
+
+    @property
+    def in_progress(self):
+        return self._held
+
+    def _begin(self, retry_id=None):
+        self._client._lock.acquire()
+        self._held, self._id = True, b"fake"
+
+    def _clean_up(self):
+        self._writes = []
+
+    def _commit(self):
+        try:
+            return self.commit()
+        finally:
+            self._release()
+
+    def _rollback(self):
+        self._writes = []
+        self._release()
+
+    def _release(self):
+        if self._held:
+            self._held = False
+            self._client._lock.release()
+
+
+class FakeFirestore:
+    """In-memory stand-in for google.cloud.firestore.Client."""
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.RLock()
+        self.reads = self.writes = self.bytes_read = 0
+
+    def collection(self, name: str):
+        return FakeCollection(self, name)
+
+    def batch(self):
+        return FakeWriteBatch(self)
+
+    def get_all(self, references, field_paths=None, transaction=None):
+        for ref in references:
+            yield ref.get(field_paths=field_paths, transaction=transaction)
+
+    def transaction(self, **kwargs):
+        return FakeTransaction(self)
+
+
+# ─────────────────────────  WEB RISK  ────────────────────────────────────────
+class FakeWebRisk(ThreadingHTTPServer):
+    """
+    Web Risk v1 stand-in. Every call sleeps |latency| seconds (±50 % jitter)
+    and fails with 503 at |error_rate|. Operations settle to SUCCEEDED or
+    CLOSED |settle| seconds after their first sighting.
+    """
+    daemon_threads = True
+
+    def __init__(self, port: int = 0, latency: float = 0.05,
+                 error_rate: float = 0.0, settle: float = 30.0):
+        super().__init__(("127.0.0.1", port), _Handler)
+        self.latency, self.error_rate, self.settle = latency, error_rate, settle
+        self.first_seen = {}
+        self.calls      = 0
+        self._ids       = itertools.count(1)
+        self._lock      = threading.Lock()
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def start(self) -> "FakeWebRisk":
+        threading.Thread(target=self.serve_forever, name="fake-webrisk", daemon=True).start()
+        return self
+
+    def operation(self, name: str) -> dict:
+        with self._lock:
+            seen = self.first_seen.setdefault(name, time.time())
+        state = "RUNNING"
+        if time.time() - seen >= self.settle:
+            # stable verdict per name
+            state = "SUCCEEDED" if hashlib.sha1(name.encode()).digest()[0] % 4 else "CLOSED"
+        return {"name": name, "metadata": {
+            "@type": "type.googleapis.com/google.cloud.webrisk.v1.SubmitUriMetadata",
+            "state": state,
+            "createTime": datetime.fromtimestamp(seen, timezone.utc)
+                                  .isoformat().replace("+00:00", "Z"),
+        }}
+
+    def new_operation(self, parent: str) -> dict:
+        return self.operation(f"{parent}/operations/{next(self._ids)}")
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: FakeWebRisk
+    protocol_version = "HTTP/1.1"                   # keep-alive like the real API
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, status: int, body: dict):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _simulate(self) -> bool:
+        """Apply latency / injected errors; False when an error was sent."""
+        srv = self.server
+        with srv._lock:
+            srv.calls += 1
+        time.sleep(srv.latency * random.uniform(0.5, 1.5))
+        if random.random() < srv.error_rate:
+            self._reply(503, {"error": {"code": 503, "status": "UNAVAILABLE"}})
+            return False
+        return True
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        self.rfile.read(length)
+        path = urlsplit(self.path).path
+        if path.endswith("/token"):                 # service-account JWT exchange
+            return self._reply(200, {"access_token": "fake-token", "token_type": "Bearer",
+                                     "expires_in": 3600})
+        if not self._simulate():
+            return
+        if path.startswith("/v1/") and path.endswith("/uris:submit"):
+            parent = path[len("/v1/"):-len("/uris:submit")]
+            return self._reply(200, self.server.new_operation(parent))
+        self._reply(404, {"error": {"code": 404, "message": path}})
+
+    def do_GET(self):
+        if not self._simulate():
+            return
+        parts = urlsplit(self.path)
+        path  = parts.path[len("/v1/"):]
+        if path.count("/") == 3 and "/operations/" in path:
+            return self._reply(200, self.server.operation(path))
+        if path.endswith("/operations"):
+            project = path[:-len("/operations")]
+            query   = parse_qs(parts.query)
+            size    = int(query.get("pageSize", ["100"])[0])
+            start   = int(query.get("pageToken", ["0"])[0])
+            with self.server._lock:
+                names = sorted(n for n in self.server.first_seen if n.startswith(project + "/"))
+            body = {"operations": [self.server.operation(n) for n in names[start:start + size]]}
+            if start + size < len(names):
+                body["nextPageToken"] = str(start + size)
+            return self._reply(200, body)
+        self._reply(404, {"error": {"code": 404, "message": parts.path}})
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__,
+                                formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--port", type=int, default=9090)
+    p.add_argument("--latency", type=float, default=80, help="ms per call (default: 80)")
+    p.add_argument("--error-rate", type=float, default=0.0, help="share of 503s (0-1)")
+    p.add_argument("--settle", type=float, default=30, help="seconds until a verdict")
+    args = p.parse_args()
+    srv = FakeWebRisk(args.port, args.latency / 1000, args.error_rate, args.settle)
+    print(f"fake Web Risk on {srv.base_url}/v1 — token endpoint {srv.base_url}/token")
+    srv.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Listing cost with and without field projection: bytes and latency per
+1,000 operations read through list_operation_records().
+
+    python bench/projection.py                  # in-memory Firestore stand-in
+    FIRESTORE_EMULATOR_HOST=localhost:8086 python bench/projection.py --docs 2000
+
+"whole docs" is the listing as it was before projection (every field,
+payload included); "table" is what /operations reads now; "names" is
+list_operations().
+"""
+import argparse
+import json
+import os
+import pathlib
+import statistics
+import sys
+import time
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from bench.fakes import FakeFirestore                           # noqa: E402
+
+
+def _payload(i: int) -> dict:
+    """A fully filled-in submit form, i.e. the largest payloads we store."""
+    uri = f"https://login-{i}.phish.example/account/verify?session={i:08d}"
+    return {
+        "submission": {"uri": uri},
+        "threatInfo": {
+            "abuseType": "SOCIAL_ENGINEERING",
+            "threatConfidence": {"level": "HIGH"},
+            "threatJustification": {
+                "labels": ["MANUAL_VERIFICATION", "USER_REPORT"],
+                "comments": ["Impersonates our sign-in page; reported by several customers "
+                             "through the support form, confirmed by the security team."],
+            },
+        },
+        "threatDiscovery": {"platform": "WINDOWS", "regionCodes": ["US", "FR", "DE", "GB"]},
+    }
+
+
+def measure(read, db, runs: int) -> tuple[float, int, int]:
+    """(median ms, bytes, records) of |read|()."""
+    times, size, count = [], 0, 0
+    for _ in range(runs):
+        before = getattr(db, "bytes_read", None)
+        t0 = time.perf_counter()
+        records = read()
+        times.append(time.perf_counter() - t0)
+        if before is not None:
+            size = db.bytes_read - before
+        else:                                   # emulator: size of what came back
+            size = len(json.dumps(records, default=str))
+        count = len(records)
+    return statistics.median(times) * 1000, size, count
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__,
+                                formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--docs", type=int, default=5000, help="operations to seed")
+    p.add_argument("--runs", type=int, default=5)
+    args = p.parse_args()
+
+    os.environ.setdefault("COLLECTION_NAME", "bench-projection")
+    import main as app
+    db = None
+    if not os.getenv("FIRESTORE_EMULATOR_HOST"):
+        db = FakeFirestore()
+        app.set_db(db)
+    app.save_operations([
+        (f"projects/1/operations/{i}", _payload(i)["submission"]["uri"], _payload(i),
+         "SUCCEEDED", "2025-07-09T16:10:21Z")
+        for i in range(args.docs)
+    ])
+
+    listings = {
+        "whole docs": lambda: app.list_operation_records(args.docs, fields=None),
+        "table":      lambda: app.list_operation_records(args.docs),
+        "names":      lambda: app.list_operations(args.docs),
+    }
+    print(f"{'listing':<14}{'KB / 1k docs':>14}{'ms / 1k docs':>14}")
+    for label, read in listings.items():
+        ms, size, count = measure(read, db, args.runs)
+        per_k = 1000 / max(count, 1)
+        print(f"{label:<14}{size * per_k / 1024:>14.1f}{ms * per_k:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
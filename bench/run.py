@@ -0,0 +1,229 @@
+"""
+Offline benchmark: the real app against local Web Risk and Firestore
+stand-ins (bench/fakes.py), so it runs on a laptop or in CI without a
+GCP project.
+
+    python bench/run.py                         # defaults, prints a table
+    python bench/run.py --save-baseline         # record bench/results/baseline.json
+    python bench/run.py --check                 # exit 1 on a >20 % regression or no baseline
+
+Measures /operations latency and time-to-first-byte as the collection grows
+and /submit throughput at increasing concurrency. With
+FIRESTORE_EMULATOR_HOST set, the Firestore emulator is used instead of the
+in-memory fake.
+"""
+import argparse
+import contextlib
+import json
+import logging
+import os
+import pathlib
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import requests
+import rsa
+
+ROOT    = pathlib.Path(__file__).resolve().parent.parent
+RESULTS = ROOT / "bench" / "results"
+sys.path.insert(0, str(ROOT))
+
+from bench.fakes import FakeFirestore, FakeWebRisk            # noqa: E402
+
+
+def _service_account(token_uri: str) -> dict:
+    """Throw-away service-account key whose token exchange hits the fake."""
+    _, key = rsa.newkeys(2048)
+    return {
+        "type": "service_account",
+        "project_id": "bench",
+        "private_key_id": "bench",
+        "private_key": key.save_pkcs1().decode(),
+        "client_email": "bench@bench.iam.gserviceaccount.com",
+        "client_id": "0",
+        "token_uri": token_uri,
+    }
+
+
+def setup(args, tmp: pathlib.Path):
+    """Start the fake Web Risk, configure and import main, serve it locally."""
+    webrisk = FakeWebRisk(latency=args.latency / 1000, error_rate=args.error_rate,
+                          settle=args.settle).start()
+    key = _service_account(f"{webrisk.base_url}/token")
+    (tmp / "key.json").write_text(json.dumps(key))
+
+    os.environ.update({
+        "COLLECTION_NAME":  "bench-operations",
+        "WEBRISK_KEY_PATH": str(tmp / "key.json"),
+        "WEBRISK_API":      f"{webrisk.base_url}/v1",
+        "OUTBOX_DIR":       str(tmp / "outbox"),
+        "REFRESH_MODE":     "page",
+        "QUOTA_FILE":       str(tmp / "quota"),
+    })
+    os.environ.setdefault("QUOTA_SUBMIT_RATE", "0")     # measure the app, not the limiter
+    os.environ.setdefault("QUOTA_STATUS_RATE", "0")
+    import main
+    if not os.getenv("FIRESTORE_EMULATOR_HOST"):
+        main.set_db(FakeFirestore())
+    main.outbox.start()
+
+    from werkzeug.serving import make_server
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    server = make_server("127.0.0.1", 0, main.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return main, webrisk, server, key
+
+
+def seed(main, webrisk, count: int, offset: int):
+    """Add operations until the collection holds |count| of them."""
+    ops = []
+    for i in range(offset, count):
+        op  = webrisk.new_operation("projects/1")
+        uri = f"https://seed.example/{i}"
+        ops.append((op["name"], uri, {"submission": {"uri": uri}},
+                    op["metadata"]["state"], op["metadata"]["createTime"]))
+    for start in range(0, len(ops), 1000):
+        main.save_operations(ops[start:start + 1000])
+
+
+def bench_operations(base: str, repeats: int) -> dict:
+    total, ttfb = [], []
+    with requests.Session() as s:
+        for _ in range(repeats):
+            t0 = time.perf_counter()
+            with s.get(f"{base}/operations", stream=True) as r:
+                r.raise_for_status()
+                it = r.iter_content(chunk_size=None)
+                next(it, None)
+                ttfb.append(time.perf_counter() - t0)
+                for _ in it:
+                    pass
+            total.append(time.perf_counter() - t0)
+    return {"p50_ms":  statistics.median(total) * 1000,
+            "max_ms":  max(total) * 1000,
+            "ttfb_ms": statistics.median(ttfb) * 1000}
+
+
+def bench_submit(base: str, key: dict, concurrency: int, count: int, tag: str) -> dict:
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_maxsize=concurrency)
+    session.mount("http://", adapter)
+    sa_key  = json.dumps(key)
+    errors  = 0
+    lock    = threading.Lock()
+
+    def one(i: int):
+        nonlocal errors
+        r = session.post(f"{base}/submit", data={
+            "parent": "1", "uri": f"https://bench.example/{tag}/{i}", "sa_key": sa_key})
+        if r.status_code != 200:
+            with lock:
+                errors += 1
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(count)))
+    elapsed = time.perf_counter() - t0
+    return {"rps": count / elapsed, "errors": errors}
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> list[str]:
+    """Metrics that got worse than |baseline| by more than |threshold|."""
+    worse = []
+    for section, rows in baseline.get("results", {}).items():
+        for size, old in rows.items():
+            new = current["results"].get(section, {}).get(size)
+            if not new:
+                continue
+            for metric, before in old.items():
+                after = new.get(metric)
+                if after is None or metric == "errors" or not before:
+                    continue
+                # throughput: higher is better; latency: lower is better
+                change = (before - after) / before if metric == "rps" else (after - before) / before
+                if change > threshold:
+                    worse.append(f"{section}[{size}].{metric}: {before:.1f} → {after:.1f} "
+                                 f"({change:+.0%})")
+    return worse
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__,
+                                formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--sizes", default="100,1000,5000",
+                   help="collection sizes for /operations (default: 100,1000,5000)")
+    p.add_argument("--concurrency", default="1,8,32",
+                   help="parallel clients for /submit (default: 1,8,32)")
+    p.add_argument("--submits", type=int, default=200, help="submits per concurrency level")
+    p.add_argument("--repeats", type=int, default=5, help="/operations loads per size")
+    p.add_argument("--latency", type=float, default=50, help="fake Web Risk ms per call")
+    p.add_argument("--error-rate", type=float, default=0.0, help="fake Web Risk 503 share")
+    p.add_argument("--settle", type=float, default=3600,
+                   help="seconds until fake operations finish (default: never)")
+    p.add_argument("--threshold", type=float, default=0.20, help="regression tolerance")
+    p.add_argument("--check", action="store_true", help="exit 1 on regression vs baseline")
+    p.add_argument("--save-baseline", action="store_true")
+    p.add_argument("--verbose", action="store_true", help="keep the app's request logs")
+    args = p.parse_args()
+
+    quiet = contextlib.nullcontext() if args.verbose else \
+        contextlib.redirect_stdout(open(os.devnull, "w"))
+    with tempfile.TemporaryDirectory() as tmp, quiet:
+        app, webrisk, server, key = setup(args, pathlib.Path(tmp))
+        base = f"http://127.0.0.1:{server.server_port}"
+        results = {"operations": {}, "submit": {}}
+
+        seeded = 0
+        for size in map(int, args.sizes.split(",")):
+            seed(app, webrisk, size, seeded)
+            seeded = size
+            results["operations"][str(size)] = bench_operations(base, args.repeats)
+        for conc in map(int, args.concurrency.split(",")):
+            results["submit"][str(conc)] = bench_submit(base, key, conc, args.submits,
+                                                        tag=f"c{conc}-{time.time_ns()}")
+        server.shutdown()
+        app.outbox.drain()
+
+    report = {
+        "when": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "settings": {k: v for k, v in vars(args).items()
+                     if k not in ("check", "save_baseline", "threshold")},
+        "backend": "emulator" if os.getenv("FIRESTORE_EMULATOR_HOST") else "fake",
+        "results": results,
+    }
+
+    print(f"{'/operations':<20}{'p50 ms':>10}{'max ms':>10}{'ttfb ms':>10}")
+    for size, r in results["operations"].items():
+        print(f"{size + ' docs':<20}{r['p50_ms']:>10.1f}{r['max_ms']:>10.1f}{r['ttfb_ms']:>10.1f}")
+    print(f"{'/submit':<20}{'req/s':>10}{'errors':>10}")
+    for conc, r in results["submit"].items():
+        print(f"{conc + ' clients':<20}{r['rps']:>10.1f}{r['errors']:>10}")
+
+    RESULTS.mkdir(exist_ok=True)
+    out = RESULTS / f"{report['when'].replace(':', '')}.json"
+    out.write_text(json.dumps(report, indent=2))
+    print(f"saved {out.relative_to(ROOT)}")
+
+    baseline = RESULTS / "baseline.json"
+    if args.save_baseline:
+        baseline.write_text(json.dumps(report, indent=2))
+        print("baseline updated")
+    elif args.check and not baseline.exists():
+        print(f"no {baseline.relative_to(ROOT)} to check against: "
+              "record one with --save-baseline (same settings) and commit it")
+        sys.exit(1)
+    elif baseline.exists():
+        worse = compare(report, json.loads(baseline.read_text()), args.threshold)
+        for line in worse:
+            print(f"REGRESSION {line}")
+        if worse and args.check:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
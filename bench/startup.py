@@ -0,0 +1,63 @@
+"""
+Cold-start benchmark: import time of main.py and latency of the first
+request(s) in a fresh interpreter, median over several runs.
+
+    python bench/startup.py                     # GET / and the shared CSS
+    python bench/startup.py --runs 20 --path /operations   # needs Firestore
+"""
+import argparse
+import json
+import os
+import pathlib
+import statistics
+import subprocess
+import sys
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+
+# runs in a brand-new interpreter so nothing is warm
+PROBE = r"""
+import json, sys, time
+t0 = time.perf_counter()
+import main
+t1 = time.perf_counter()
+client = main.app.test_client()
+out = {"import": t1 - t0}
+for label in sys.argv[1:]:
+    path = main.CSS_HREF if label == "css" else label
+    t = time.perf_counter()
+    resp = client.get(path)
+    resp.get_data()                     # drain streamed bodies
+    out[label] = time.perf_counter() - t
+out["firestore loaded"] = "google.cloud.firestore" in sys.modules
+print(json.dumps(out))
+"""
+
+
+def run_once(paths: list[str]) -> dict:
+    env = dict(os.environ)
+    env.setdefault("COLLECTION_NAME", "bench-operations")
+    proc = subprocess.run([sys.executable, "-c", PROBE, *paths], cwd=ROOT, env=env,
+                          capture_output=True, text=True, check=True)
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__,
+                                formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--runs", type=int, default=10)
+    p.add_argument("--path", action="append",
+                   help='request path to time, "css" = shared CSS (repeatable; default: / css)')
+    args  = p.parse_args()
+    paths = args.path or ["/", "css"]
+
+    runs = [run_once(paths) for _ in range(args.runs)]
+    print(f"{'phase':<28}{'median ms':>12}{'max ms':>10}")
+    for key in ["import", *paths]:
+        vals = [r[key] * 1000 for r in runs]
+        print(f"{key:<28}{statistics.median(vals):>12.1f}{max(vals):>10.1f}")
+    print(f"firestore imported at startup: {runs[0]['firestore loaded']}")
+
+
+if __name__ == "__main__":
+    main()
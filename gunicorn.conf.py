@@ -0,0 +1,23 @@
+# gunicorn.conf.py — read by `gunicorn -c gunicorn.conf.py main:app`
+import os
+
+bind = f":{os.getenv('PORT', '8080')}"
+
+# I/O-bound routes (Web Risk, Firestore) → few processes, many threads each
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gthread")
+workers      = int(os.getenv("GUNICORN_WORKERS", "2"))
+threads      = int(os.getenv("GUNICORN_THREADS", "8"))
+timeout      = int(os.getenv("GUNICORN_TIMEOUT", "120"))   # streamed pages / batches
+
+# import main.py once in the master and fork it: workers share the loaded
+# modules instead of each paying the import. Clients that must not cross a
+# fork (Firestore/grpc, HTTP session) are created lazily inside each worker.
+preload_app = os.getenv("GUNICORN_PRELOAD", "1") == "1"
+
+
+def post_fork(server, worker):
+    import main
+    main.outbox.start()                 # replays journals of dead workers
+    main.metrics.share(main.METRICS_DIR, main.METRICS_INTERVAL)     # /metrics for all workers
+    if main.REFRESH_MODE == "thread":
+        main.start_refresher()
@@ -1,17 +1,101 @@
 # app.py
-from flask import Flask, request, jsonify, render_template_string
-from datetime import datetime
-import json, os, pathlib, requests
-from google.oauth2 import service_account
-from google.auth.transport.requests import Request as GoogleRequest
-import google.auth.transport.requests
-import google.auth
-from google.cloud import firestore
-import base64, hashlib
-
-db = firestore.Client(database="brand-submitter", project="regulator-wr")
-COLL = os.environ["COLLECTION_NAME"]    
-print(COLL)                     # collection name
+from flask import Flask, Response, g, has_request_context, request, jsonify, stream_with_context
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+import atexit, csv, fcntl, gzip, json, os, pathlib, queue, random, requests, socket, struct, threading, time, zlib
+from email.utils import parsedate_to_datetime
+from requests.adapters import HTTPAdapter
+from collections import OrderedDict
+from contextlib import contextmanager
+import base64, hashlib, heapq, importlib, io, math
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import metrics
+
+try:                                # optional: br for clients that accept it
+    import brotli
+except ImportError:
+    brotli = None
+
+class _LazyModule:
+    """Import |name| on first attribute access (keeps grpc & co. off cold start)."""
+
+    def __init__(self, name: str):
+        self._name, self._mod = name, None
+
+    def __getattr__(self, attr):
+        if self._mod is None:
+            self._mod = importlib.import_module(self._name)
+        return getattr(self._mod, attr)
+
+firestore       = _LazyModule("google.cloud.firestore")
+service_account = _LazyModule("google.oauth2.service_account")
+google_requests = _LazyModule("google.auth.transport.requests")
+
+COLL = os.environ["COLLECTION_NAME"]    # collection name
+
+# FIRESTORE_EMULATOR_HOST is honoured by the client library itself
+FIRESTORE_PROJECT  = os.getenv("FIRESTORE_PROJECT", "regulator-wr")
+FIRESTORE_DATABASE = os.getenv("FIRESTORE_DATABASE", "brand-submitter")
+
+_db = None
+_db_lock = threading.Lock()
+
+def get_db():
+    """Firestore client, built on first use — i.e. inside each forked worker."""
+    global _db
+    if _db is None:
+        with _db_lock:
+            if _db is None:
+                _db = firestore.Client(database=FIRESTORE_DATABASE, project=FIRESTORE_PROJECT)
+    return _db
+
+def set_db(client):
+    """Use |client| instead of a real Firestore client (tests, benchmarks)."""
+    global _db
+    _db = client
+
+# ─────────────────────────  INSTRUMENTATION  ─────────────────────────────────
+METRICS_DIR      = os.getenv("METRICS_DIR", "/dev/shm/wr-metrics" if os.path.isdir("/dev/shm")
+                             else "/tmp/wr-metrics")            # one file per worker
+METRICS_INTERVAL = float(os.getenv("METRICS_INTERVAL", "5"))    # seconds between writes
+
+REQUEST_SECONDS   = metrics.Histogram("wr_request_seconds", "HTTP request latency",
+                                      ("route", "method", "status"))
+PHASE_SECONDS     = metrics.Histogram("wr_phase_seconds", "Time spent per phase",
+                                      ("phase",))
+UPSTREAM_SECONDS  = metrics.Histogram("wr_upstream_seconds", "Web Risk call latency",
+                                      ("method",))
+UPSTREAM_TOTAL    = metrics.Counter("wr_upstream_responses_total",
+                                    "Web Risk responses by status code", ("method", "status"))
+IN_FLIGHT         = metrics.Gauge("wr_requests_in_flight", "Requests being served")
+UPSTREAM_INFLIGHT = metrics.Gauge("wr_upstream_in_flight", "Web Risk calls in flight")
+QUOTA_WAIT        = metrics.Histogram("wr_quota_wait_seconds",
+                                      "Time queued for a Web Risk quota slot", ("budget",))
+QUOTA_REFUSED     = metrics.Counter("wr_quota_refused_total",
+                                    "Calls refused: no quota slot before their deadline",
+                                    ("budget",))
+
+def log(message: str, severity: str = "INFO", **fields):
+    """One JSON line on stdout — Cloud Logging stores it as a structured entry."""
+    print(json.dumps({"severity": severity, "message": message, **fields}, default=str),
+          flush=True)
+
+@contextmanager
+def timed(phase: str):
+    """
+    Time a block as |phase| (token, firestore, webrisk, render): always into
+    the histogram, and into the current request's Server-Timing if any.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        took = time.perf_counter() - start
+        PHASE_SECONDS.observe(took, phase)
+        if has_request_context():
+            timings = g.setdefault("timings", {})
+            timings[phase] = timings.get(phase, 0) + took
 
 def _doc_id(name: str) -> str:
     """
@@ -21,41 +105,1106 @@ def _doc_id(name: str) -> str:
     digest = hashlib.sha1(name.encode()).digest()
     return base64.urlsafe_b64encode(digest).decode().rstrip("=")
 
-def save_operation(name: str, url: str, payload: dict):
-    """Add or update a Firestore document whose ID is the operation name."""
-    doc_ref = db.collection(COLL).document(_doc_id(name))
-    doc_ref.set({
-        "name":    name,
-        "url":     url,
-        "payload": payload,          # Firestore accepts nested maps
-        "created": firestore.SERVER_TIMESTAMP,
-    }, merge=True)
-
-def list_operations() -> list[str]:
-    """Return operation names currently stored (oldest first)."""
-    docs = (
-        db.collection(COLL)
+TERMINAL_STATES = {"SUCCEEDED", "CLOSED"}    # Web Risk never moves out of these
+
+BATCH_WRITE_LIMIT = 500                      # Firestore max writes per commit
+
+def parent_of(name: str) -> str:
+    """projects/{number} part of an operation name."""
+    return "/".join(name.split("/")[:2])
+
+def _operation_doc(name: str, url: str, payload: dict,
+                   state: str | None = None, create_time: str | None = None) -> dict:
+    return {
+        "name":       name,
+        "parent":     parent_of(name),  # tenant; indexed with created
+        "url":        url,
+        "payload":    payload,        # Firestore accepts nested maps
+        "created":    firestore.SERVER_TIMESTAMP,
+        "state":      state,          # last state reported by Web Risk
+        "createTime": create_time,    # Web Risk metadata.createTime (ISO)
+        "lastPolled": None,           # set once a status GET succeeded
+        "pollCount":  0,              # drives the refresher's backoff
+        "nextPoll":   firestore.SERVER_TIMESTAMP,   # due right away
+    }
+
+def backfill_operation_doc(data: dict) -> dict:
+    """
+    Fields _operation_doc() writes today that |data| (an older document) is
+    missing, derived from what it has. Existing values are never touched.
+    """
+    if not data.get("name"):
+        return {}                     # legacy hash-keyed docs: nothing to derive from
+    current = _operation_doc(data["name"], data.get("url", ""), data.get("payload", {}),
+                             data.get("state"), data.get("createTime"))
+    if data.get("state") in TERMINAL_STATES:
+        current["nextPoll"] = None    # settled, keep it out of the refresher
+    return {k: v for k, v in current.items() if k not in data}
+
+def save_operation(name: str, url: str, payload: dict,
+                   state: str | None = None, create_time: str | None = None):
+    """Add a Firestore document whose ID is the operation name (once)."""
+    save_operations([(name, url, payload, state, create_time)])
+
+def save_operations(ops: list[tuple]):
+    """
+    save_operation() for many (name, url, payload, state, createTime) at
+    once, together with their duplicate-index entries. Operations already
+    stored are left alone, so replaying an outbox entry whose commit was
+    never acked can't reset a settled state, |created| or the poll schedule,
+    nor restart the dedupe window.
+    """
+    per_batch = BATCH_WRITE_LIMIT // 2                  # 2 writes per operation
+    coll = get_db().collection(COLL)
+
+    @firestore.transactional
+    def create_missing(txn, chunk: list[tuple]):
+        todo   = {_doc_id(op[0]): op for op in chunk}
+        stored = {snap.id for snap in get_db().get_all(
+                      [coll.document(d) for d in todo], field_paths=["name"],
+                      transaction=txn) if snap.exists}
+        for doc_id, op in todo.items():
+            if doc_id in stored:                        # a replay: first write won
+                continue
+            txn.set(coll.document(doc_id), _operation_doc(*op))
+            parent = parent_of(op[0])
+            txn.set(get_db().collection(DEDUPE_COLL).document(_dedupe_key(parent, op[1])), {
+                "parent":    parent,
+                "uri":       normalize_uri(op[1]),
+                "name":      op[0],
+                "submitted": firestore.SERVER_TIMESTAMP,
+            })
+
+    for i in range(0, len(ops), per_batch):
+        create_missing(get_db().transaction(), ops[i:i + per_batch])
+
+def save_operation_states(updates: list[tuple[str, str, str | None]]):
+    """Write back (name, state, createTime) newly seen on Web Risk in one batch."""
+    batch = get_db().batch()
+    for name, state, create_time in updates:
+        batch.update(get_db().collection(COLL).document(_doc_id(name)), {
+            "state":        state,
+            "createTime":   create_time,
+            "lastPolled":   firestore.SERVER_TIMESTAMP,
+            "stateChanged": firestore.SERVER_TIMESTAMP,   # watched by live updates
+            "nextPoll":     None,     # drops out of the refresher's due query
+        })
+    batch.commit()
+    for name, state, create_time in updates:
+        live.publish(_doc_id(name), state, create_time)
+
+# ─────────────────────────  DUPLICATE INDEX  ─────────────────────────────────
+DEDUPE_COLL         = os.getenv("DEDUPE_COLLECTION", f"{COLL}-dedupe")
+DEDUPE_WINDOW       = float(os.getenv("DEDUPE_WINDOW", "86400"))      # 0 = off
+DEDUPE_NEGATIVE_TTL = float(os.getenv("DEDUPE_NEGATIVE_TTL", "60"))   # trust a miss this long
+DEDUPE_CACHE_SIZE   = int(os.getenv("DEDUPE_CACHE_SIZE", "10000"))
+
+TRACKING_PARAMS  = {"fbclid", "gclid", "dclid", "msclkid", "igshid", "mc_cid", "mc_eid",
+                    "_ga", "_gl", "yclid", "twclid"}
+DEFAULT_PORTS    = {"http": 80, "https": 443}
+
+def normalize_uri(uri: str) -> str:
+    """
+    Canonical form used to spot resubmissions: lower-case scheme and host,
+    no default port, fragment, trailing slash or tracking parameters
+    (utm_*, fbclid, gclid …); remaining query parameters sorted.
+    """
+    uri = uri.strip()
+    if "://" not in uri:
+        uri = "http://" + uri
+    parts  = urlsplit(uri)
+    scheme = parts.scheme.lower()
+    host   = (parts.hostname or "").rstrip(".")
+    if parts.port and parts.port != DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{parts.port}"
+    if parts.username:
+        host = f"{parts.username}@{host}"
+    query = sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+                   if not k.lower().startswith("utm_") and k.lower() not in TRACKING_PARAMS)
+    return urlunsplit((scheme, host, parts.path.rstrip("/"), urlencode(query), ""))
+
+def _dedupe_key(parent: str, uri: str) -> str:
+    return hashlib.sha256(f"{parent}\n{normalize_uri(uri)}".encode()).hexdigest()
+
+# key → (operation name | None, epoch seconds submitted / checked)
+_dedupe_cache: "OrderedDict[str, tuple[str | None, float]]" = OrderedDict()
+_dedupe_lock = threading.Lock()
+
+def _dedupe_remember(key: str, name: str | None, when: float):
+    with _dedupe_lock:
+        _dedupe_cache[key] = (name, when)
+        _dedupe_cache.move_to_end(key)
+        while len(_dedupe_cache) > DEDUPE_CACHE_SIZE:
+            _dedupe_cache.popitem(last=False)
+
+def find_duplicate(parent: str, uri: str) -> str | None:
+    """
+    Name of the operation that already covers (parent, uri) if it was
+    submitted less than DEDUPE_WINDOW seconds ago, else None. Recent hits
+    and misses are answered from memory; otherwise one index document read.
+    """
+    if DEDUPE_WINDOW <= 0:
+        return None
+    key, now = _dedupe_key(parent, uri), time.time()
+    with _dedupe_lock:
+        hit = _dedupe_cache.get(key)
+    if hit:
+        name, when = hit
+        if name and now - when < DEDUPE_WINDOW:
+            return name
+        if name is None and now - when < DEDUPE_NEGATIVE_TTL:
+            return None
+
+    with timed("firestore"):
+        doc = get_db().collection(DEDUPE_COLL).document(key).get()
+    data = doc.to_dict() or {}
+    submitted = data.get("submitted")
+    if data.get("name") and submitted and now - submitted.timestamp() < DEDUPE_WINDOW:
+        _dedupe_remember(key, data["name"], submitted.timestamp())
+        return data["name"]
+    _dedupe_remember(key, None, now)
+    return None
+
+def remember_submission(parent: str, uri: str, name: str):
+    """Make this worker see |name| as a duplicate before the outbox commits it."""
+    _dedupe_remember(_dedupe_key(parent, uri), name, time.time())
+
+# ─────────────────────────  WRITE-BEHIND OUTBOX  ─────────────────────────────
+OUTBOX_DIR      = os.getenv("OUTBOX_DIR", "/tmp/wr-outbox")       # local journals
+OUTBOX_INTERVAL = float(os.getenv("OUTBOX_INTERVAL", "0.5"))      # max wait to fill a batch
+OUTBOX_DRAIN    = float(os.getenv("OUTBOX_DRAIN", "8"))           # seconds to flush on exit
+
+class Outbox:
+    """
+    Write-behind queue in front of save_operations(). put() only appends the
+    operation to a local journal (fsync'd) and returns; a background thread
+    coalesces queued operations into Firestore batches and retries them until
+    they commit. Journals left behind by dead processes are replayed by the
+    next process that starts, and the queue is flushed on interpreter exit.
+    """
+
+    def __init__(self, directory: str):
+        self.dir   = pathlib.Path(directory)
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._pid  = None               # process that owns the journal / thread
+
+    def start(self):
+        """Open this process' journal, start the writer, adopt orphans."""
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self.dir.mkdir(parents=True, exist_ok=True)
+            self._queue   = queue.Queue()
+            self._seq     = 0
+            self._unacked = 0
+            self._pid     = os.getpid()
+            path = self.dir / f"outbox-{socket.gethostname()}-{os.getpid()}-{time.time_ns()}.jsonl"
+            self._journal = open(path, "a", encoding="utf-8")
+            fcntl.flock(self._journal, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            for p in self.dir.glob("outbox-*.jsonl"):
+                if p != path:
+                    self._adopt(p)
+            threading.Thread(target=self._run, name="wr-outbox", daemon=True).start()
+            atexit.register(self.drain)
+
+    def _adopt(self, path: pathlib.Path):
+        """Re-queue unacknowledged entries of a journal no live process holds."""
+        try:
+            f = open(path, "r", encoding="utf-8")
+        except FileNotFoundError:
+            return
+        with f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return                              # its owner is still running
+            if os.fstat(f.fileno()).st_nlink == 0:
+                return                              # adopted by someone else first
+            entries, acked = {}, set()
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    continue                        # torn last line
+                if "ack" in rec:
+                    acked.update(rec["ack"])
+                else:
+                    entries[rec["seq"]] = rec["op"]
+            replay = [op for seq, op in entries.items() if seq not in acked]
+            for op in replay:
+                self._append(op)
+            os.unlink(path)
+        if replay:
+            log("outbox replayed journal", journal=path.name, operations=len(replay))
+
+    def _append(self, op) -> None:
+        """Journal + enqueue |op|; caller holds self._lock."""
+        self._seq += 1
+        self._journal.write(json.dumps({"seq": self._seq, "op": list(op)}, default=str) + "\n")
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+        self._unacked += 1
+        self._queue.put((self._seq, tuple(op)))
+
+    def put(self, op: tuple):
+        """Queue (name, url, payload, state, createTime) for save_operations()."""
+        self.start()
+        with self._lock:
+            self._append(op)
+
+    def _take(self) -> list:
+        items = [self._queue.get()]                 # block for the first one
+        until = time.monotonic() + OUTBOX_INTERVAL
+        while len(items) < BATCH_WRITE_LIMIT:
+            try:
+                items.append(self._queue.get(timeout=max(0, until - time.monotonic())))
+            except queue.Empty:
+                break
+        return items
+
+    def _run(self):
+        while True:
+            items  = self._take()
+            latest = {op[0]: op for _, op in items}     # coalesce: last write wins
+            delay  = 1
+            while True:
+                try:
+                    save_operations(list(latest.values()))
+                    break
+                except Exception as exc:
+                    log("outbox commit failed, retrying", "WARNING",
+                        operations=len(latest), error=str(exc))
+                    time.sleep(delay)
+                    delay = min(delay * 2, 30)
+            with self._lock:
+                self._journal.write(json.dumps({"ack": [seq for seq, _ in items]}) + "\n")
+                self._unacked -= len(items)
+                if self._unacked == 0:              # everything is in Firestore
+                    self._journal.truncate(0)
+                    self._idle.notify_all()
+                self._journal.flush()
+
+    def drain(self, timeout: float = OUTBOX_DRAIN) -> bool:
+        """Wait until every queued operation is committed (or |timeout|)."""
+        with self._lock:
+            if self._pid != os.getpid():
+                return True
+            return self._idle.wait_for(lambda: self._unacked == 0, timeout)
+
+outbox = Outbox(OUTBOX_DIR)
+
+# what the table needs; payloads are fetched per operation on demand
+LIST_FIELDS = ["name", "url", "created", "state", "createTime", "lastPolled"]
+
+def list_operation_records(page_size: int | None = None,
+                           cursor: str | None = None,
+                           states: list[str] | None = None,
+                           since: datetime | None = None,
+                           until: datetime | None = None,
+                           parent: str | None = None,
+                           fields: list[str] | None = LIST_FIELDS,
+                           archived: bool = False) -> list[dict]:
+    """
+    Return stored operations (newest first) as dicts with id, name, url,
+    created and the cached state — one streamed query, no per-doc get().
+    |page_size| caps the result; |cursor| is the doc ID of the last record
+    of the previous page. |states|, |since| / |until| and |parent| filter on
+    the stored state, |created| and the tenant (see firestore.indexes.json). Only
+    |fields| are downloaded; add "payload" to get it, None for everything.
+    |archived| reads ARCHIVE_COLL instead of the hot collection.
+    """
+    coll  = ARCHIVE_COLL if archived else COLL
+    query = get_db().collection(coll)
+    if parent:
+        query = query.where("parent", "==", parent)
+    if states:
+        query = query.where("state", "in", states)
+    if since:
+        query = query.where("created", ">=", since)
+    if until:
+        query = query.where("created", "<", until)
+    query = query.order_by("created", direction=firestore.Query.DESCENDING)
+    if fields is not None:
+        query = query.select(fields)
+    if cursor:
+        # the cursor only needs the order-by value, not the whole document
+        last = get_db().collection(coll).document(cursor).get(field_paths=["created"])
+        if last.exists:
+            query = query.start_after(last)
+    if page_size:
+        query = query.limit(page_size)
+
+    records = []
+    for d in query.stream():
+        data = d.to_dict() or {}
+        record = {
+            "id":      d.id,
+            "name":    data.get("name") or d.id,     # fall-back = old hash
+            "url":     data.get("url", "(unknown)"),
+            "created": data.get("created"),
+            "state":      data.get("state"),
+            "createTime": data.get("createTime"),
+            "lastPolled": data.get("lastPolled"),
+            "parent":     data.get("parent") or parent_of(data.get("name") or ""),
+        }
+        if fields is None or "payload" in fields:
+            record["payload"] = data.get("payload", {})
+        records.append(record)
+    return records
+
+def iter_operation_records(page_size: int, **filters):
+    """
+    list_operation_records() page after page, for reading any number of
+    operations in constant memory; every page is a new short query.
+    """
+    cursor = None
+    while True:
+        with timed("firestore"):
+            page = list_operation_records(page_size, cursor, **filters)
+        yield from page
+        if len(page) < page_size:
+            return
+        cursor = page[-1]["id"]
+
+def list_operations(limit: int | None = None) -> list[str]:
+    """Return operation names currently stored (newest first), at most |limit|."""
+    return [r["name"] for r in list_operation_records(limit, fields=["name"])]
+
+def collection_version() -> str:
+    """
+    Change stamp of the collection: newest |created|, newest |stateChanged|
+    and newest archive move. Three limit-1 index reads, no scan;
+    |lastPolled| is left out on purpose since it moves on every poll,
+    changed or not.
+    """
+    stamp = []
+    for coll, field in ((COLL, "created"), (COLL, "stateChanged"),
+                        (ARCHIVE_COLL, "archived")):
+        newest = list(get_db().collection(coll)
+                      .order_by(field, direction=firestore.Query.DESCENDING)
+                      .limit(1).select([field]).stream())
+        stamp.append(str(newest[0].get(field)) if newest else "-")
+    return hashlib.sha1("|".join(stamp).encode()).hexdigest()[:20]
+
+def has_unsettled() -> bool:
+    """
+    Whether some stored operation may still change state on Web Risk, i.e.
+    still has a |nextPoll| (settled ones get None). One limit-1 read.
+    """
+    return bool(list(get_db().collection(COLL).where("nextPoll", "!=", None)
+                     .limit(1).select(["nextPoll"]).stream()))
+
+# ─────────────────────────  RETENTION  ───────────────────────────────────────
+ARCHIVE_COLL       = os.getenv("ARCHIVE_COLLECTION", f"{COLL}-archive")
+ARCHIVE_AFTER_DAYS = float(os.getenv("ARCHIVE_AFTER_DAYS", "30"))   # settled this long → archive
+
+def archive_operations(older_than: timedelta = timedelta(days=ARCHIVE_AFTER_DAYS),
+                       page_size: int = BATCH_WRITE_LIMIT // 2,
+                       dry_run: bool = False) -> int:
+    """
+    Move operations that have been SUCCEEDED / CLOSED for longer than
+    |older_than| from COLL to ARCHIVE_COLL, copy + delete in one batch per
+    page so a document is never in both or neither. Returns how many moved.
+    """
+    cutoff = datetime.now(timezone.utc) - older_than
+    # created <= settled time, so this is a superset; the exact test is below
+    query  = (
+        get_db().collection(COLL)
+        .where("state", "in", sorted(TERMINAL_STATES))
+        .where("created", "<", cutoff)
         .order_by("created", direction=firestore.Query.DESCENDING)
-        .stream()
+        .limit(page_size)
     )
-    names = []
-    for d in docs:
-        data = d.to_dict() or {}
-        names.append(data.get("name") or d.id)   # fall-back = old hash
-    return names
+    moved, last = 0, None
+    while True:
+        page = list((query.start_after(last) if last else query).stream())
+        if not page:
+            return moved
+        last  = page[-1]
+        batch = get_db().batch()
+        for doc in page:
+            data    = doc.to_dict() or {}
+            settled = data.get("stateChanged") or data.get("lastPolled") or data.get("created")
+            if settled is None or settled >= cutoff:
+                continue                        # settled recently, keep it hot
+            batch.set(get_db().collection(ARCHIVE_COLL).document(doc.id),
+                      {**data, "archived": firestore.SERVER_TIMESTAMP})
+            batch.delete(doc.reference)
+        count = len(batch) // 2                 # commit() empties the batch
+        if count and not dry_run:
+            batch.commit()
+        moved += count
 
 app = Flask(__name__)                                  # ← no secret key
 
 KEY_PATH = os.getenv("WEBRISK_KEY_PATH", "/var/secrets/key.json")
 SCOPES   = ["https://www.googleapis.com/auth/cloud-platform"]
 
-# ──────────────────────────────────────────────────────────────────────────────
+OPS_PAGE_SIZE   = int(os.getenv("OPS_PAGE_SIZE", "50"))       # rows per /operations page
+OPS_STREAM      = os.getenv("OPS_STREAM", "1") == "1"         # flush rows as they arrive
+API_MAX_LIMIT   = int(os.getenv("API_MAX_LIMIT", "500"))      # ?limit= cap of /api/operations
+STATUS_FANOUT   = int(os.getenv("STATUS_FANOUT", "16"))       # parallel Web Risk GETs
+STATUS_DEADLINE = float(os.getenv("STATUS_DEADLINE", "8"))    # seconds per page load
+
+# fewer unsettled ops than this per project are fetched in one parallel round of GETs
+STATUS_LIST_MIN       = int(os.getenv("STATUS_LIST_MIN", str(STATUS_FANOUT)))
+STATUS_LIST_PAGE_SIZE = int(os.getenv("STATUS_LIST_PAGE_SIZE", "100")) # operations per page
+STATUS_LIST_MAX_PAGES = int(os.getenv("STATUS_LIST_MAX_PAGES", "20"))  # hard cap, then GETs
+
+# who polls RUNNING operations:
+#   page     – /operations polls them inline (default)
+#   thread   – a refresher thread in every worker, page only reads Firestore
+#   external – `python manage.py refresh` runs elsewhere, page only reads
+REFRESH_MODE       = os.getenv("REFRESH_MODE", "page")
+REFRESH_INTERVAL   = float(os.getenv("REFRESH_INTERVAL", "30"))    # seconds between passes
+REFRESH_BATCH      = int(os.getenv("REFRESH_BATCH", "200"))        # ops claimed per pass
+REFRESH_BASE_DELAY = float(os.getenv("REFRESH_BASE_DELAY", "60"))  # first re-poll after…
+REFRESH_MAX_DELAY  = float(os.getenv("REFRESH_MAX_DELAY", "3600")) # …doubling up to this
+REFRESH_LEASE      = float(os.getenv("REFRESH_LEASE", "120"))      # seconds a claim is held
+
+TOKEN_REFRESH_MARGIN = float(os.getenv("TOKEN_REFRESH_MARGIN", "300"))  # refresh 5 min early
+KEY_CACHE_SIZE       = int(os.getenv("KEY_CACHE_SIZE", "64"))     # posted keys kept (LRU)
+KEY_CACHE_TTL        = float(os.getenv("KEY_CACHE_TTL", "3600"))  # seconds a posted key lives
+
+BATCH_MAX_URIS    = int(os.getenv("BATCH_MAX_URIS", "5000"))     # per /submit/batch post
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))     # submits in flight
+BATCH_RATE        = float(os.getenv("BATCH_RATE", "5"))          # submits per second
+
+WEBRISK_API             = os.getenv("WEBRISK_API", "https://webrisk.googleapis.com/v1").rstrip("/")
+WEBRISK_POOL_SIZE       = int(os.getenv("WEBRISK_POOL_SIZE", "32"))       # keep-alive conns
+WEBRISK_CONNECT_TIMEOUT = float(os.getenv("WEBRISK_CONNECT_TIMEOUT", "5"))
+WEBRISK_READ_TIMEOUT    = float(os.getenv("WEBRISK_READ_TIMEOUT", "20"))
+WEBRISK_RETRIES         = int(os.getenv("WEBRISK_RETRIES", "3"))          # extra attempts
+WEBRISK_BACKOFF         = float(os.getenv("WEBRISK_BACKOFF", "0.5"))      # base delay (s)
+WEBRISK_MAX_BACKOFF     = float(os.getenv("WEBRISK_MAX_BACKOFF", "30"))   # cap incl. Retry-After
+
+# ─────────────────────────  CREDENTIALS  ─────────────────────────────────────
+class CachedCredentials:
+    """
+    Service-account credentials whose token is reused until it is within
+    TOKEN_REFRESH_MARGIN of expiry. Only one thread refreshes at a time;
+    while the old token is still valid the others keep using it.
+    """
+
+    def __init__(self, creds: "service_account.Credentials"):
+        self.creds = creds
+        self._lock = threading.Lock()
+
+    def _remaining(self) -> float:
+        if not self.creds.token or not self.creds.expiry:
+            return -1
+        now = datetime.now(timezone.utc).replace(tzinfo=None)   # expiry is naive UTC
+        return (self.creds.expiry - now).total_seconds()
+
+    def token(self) -> str:
+        remaining = self._remaining()
+        if remaining > TOKEN_REFRESH_MARGIN:
+            return self.creds.token
+        # expired → everybody waits for the refresh; merely close → one does it
+        with timed("token"):
+            if self._lock.acquire(blocking=remaining <= 0):
+                try:
+                    if self._remaining() <= TOKEN_REFRESH_MARGIN:
+                        self.creds.refresh(google_requests.Request())
+                finally:
+                    self._lock.release()
+        return self.creds.token
+
+_server_creds: CachedCredentials | None = None
+_server_lock = threading.Lock()
+
 def get_access_token() -> str:
-    creds = service_account.Credentials.from_service_account_file(
-        KEY_PATH, scopes=SCOPES
+    """Token for the server's own key at KEY_PATH (read from disk once)."""
+    global _server_creds
+    if _server_creds is None:
+        with _server_lock:
+            if _server_creds is None:
+                _server_creds = CachedCredentials(
+                    service_account.Credentials.from_service_account_file(
+                        KEY_PATH, scopes=SCOPES
+                    )
+                )
+    return _server_creds.token()
+
+# posted keys: in memory only, keyed by a fingerprint, TTL + LRU eviction
+_key_cache: "OrderedDict[str, tuple[float, CachedCredentials]]" = OrderedDict()
+_key_lock = threading.Lock()
+
+def _key_fingerprint(key_info: dict) -> str:
+    return hashlib.sha256(json.dumps(key_info, sort_keys=True).encode()).hexdigest()
+
+def credentials_for_key(key_info: dict) -> CachedCredentials:
+    """Return cached credentials for a posted service-account key."""
+    fp  = _key_fingerprint(key_info)
+    now = time.monotonic()
+    with _key_lock:
+        hit = _key_cache.get(fp)
+        if hit and now - hit[0] < KEY_CACHE_TTL:
+            _key_cache.move_to_end(fp)
+            return hit[1]
+
+    cached = CachedCredentials(
+        service_account.Credentials.from_service_account_info(key_info, scopes=SCOPES)
     )
-    creds.refresh(GoogleRequest())
-    return creds.token
+    with _key_lock:
+        _key_cache[fp] = (now, cached)
+        _key_cache.move_to_end(fp)
+        while len(_key_cache) > KEY_CACHE_SIZE:
+            _key_cache.popitem(last=False)
+    return cached
+
+# ─────────────────────────  WEB RISK QUOTA  ──────────────────────────────────
+QUOTA_FILE         = os.getenv("QUOTA_FILE", "/dev/shm/wr-quota" if os.path.isdir("/dev/shm")
+                               else "/tmp/wr-quota")            # shared by the workers
+QUOTA_SUBMIT_RATE  = float(os.getenv("QUOTA_SUBMIT_RATE", "5"))     # per second, 0 = off
+QUOTA_SUBMIT_BURST = float(os.getenv("QUOTA_SUBMIT_BURST", "10"))
+QUOTA_STATUS_RATE  = float(os.getenv("QUOTA_STATUS_RATE", "20"))    # GETs / listings
+QUOTA_STATUS_BURST = float(os.getenv("QUOTA_STATUS_BURST", "40"))
+QUOTA_SUBMIT_WAIT  = float(os.getenv("QUOTA_SUBMIT_WAIT", "15"))    # max queueing, seconds
+QUOTA_STATUS_WAIT  = float(os.getenv("QUOTA_STATUS_WAIT", "60"))    # pages use their deadline
+
+class QuotaTimeout(RuntimeError):
+    """No quota slot before the caller's deadline; |retry_after| seconds away."""
+
+    def __init__(self, budget: str, retry_after: float):
+        super().__init__(f"Web Risk {budget} quota exhausted, retry in {retry_after:.0f}s")
+        self.budget, self.retry_after = budget, retry_after
+
+class SharedQuota:
+    """
+    Token buckets for Web Risk calls, shared by every worker process of the
+    instance through a small file updated under flock. A caller reserves
+    the next slot and sleeps until it is due, so waiters go in order without
+    polling; a slot further away than the caller's deadline is refused
+    instead. Status reads also wait out any submit backlog, so user submits
+    go first.
+    """
+    BUDGETS = ("submit", "status")
+    _FORMAT = "4d"                      # tokens + stamp per budget
+
+    def __init__(self, path: str, limits: dict[str, tuple[float, float]]):
+        self.path, self.limits = path, limits     # budget → (rate, burst)
+        self._fd, self._pid = None, None
+        self._lock = threading.Lock()   # flock doesn't exclude threads sharing an fd
+
+    def _file(self) -> int:
+        if self._pid != os.getpid():    # a forked child must not share the parent's fd
+            self._fd  = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            self._pid = os.getpid()
+        return self._fd
+
+    @contextmanager
+    def _buckets(self):
+        """Refilled {budget: [tokens, stamp]}, written back unless the block raises."""
+        size = struct.calcsize(self._FORMAT)
+        with self._lock:
+            fd = self._file()
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                raw = os.pread(fd, size, 0)
+                now = time.monotonic()          # system-wide clock on Linux
+                if len(raw) == size:
+                    values = struct.unpack(self._FORMAT, raw)
+                else:
+                    values = [v for b in self.BUDGETS for v in (self.limits[b][1], now)]
+                buckets = {}
+                for i, budget in enumerate(self.BUDGETS):
+                    rate, burst = self.limits[budget]
+                    tokens, stamp = values[2 * i], min(values[2 * i + 1], now)
+                    buckets[budget] = [min(burst, tokens + (now - stamp) * rate), now]
+                yield buckets
+                os.pwrite(fd, struct.pack(self._FORMAT,
+                                          *(v for b in self.BUDGETS for v in buckets[b])), 0)
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+
+    def acquire(self, budget: str, wait: float) -> float:
+        """Take a |budget| slot, sleeping up to |wait| seconds; returns the time slept."""
+        rate = self.limits[budget][0]
+        if rate <= 0:
+            return 0.0
+        with self._buckets() as buckets:
+            tokens = buckets[budget][0] - 1
+            delay  = -tokens / rate if tokens < 0 else 0.0
+            submit_rate = self.limits["submit"][0]
+            if budget != "submit" and submit_rate > 0 and buckets["submit"][0] < 0:
+                delay = max(delay, -buckets["submit"][0] / submit_rate)
+            if delay > wait:
+                raise QuotaTimeout(budget, delay)
+            buckets[budget][0] = tokens
+        if delay:
+            time.sleep(delay)
+        return delay
+
+    def backoff(self, budget: str, seconds: float):
+        """Web Risk said 429: hold every worker's |budget| calls for |seconds|."""
+        rate = self.limits[budget][0]
+        if rate > 0:
+            with self._buckets() as buckets:
+                buckets[budget][0] = min(buckets[budget][0], -seconds * rate)
+
+quota = SharedQuota(QUOTA_FILE, {"submit": (QUOTA_SUBMIT_RATE, QUOTA_SUBMIT_BURST),
+                                 "status": (QUOTA_STATUS_RATE, QUOTA_STATUS_BURST)})
+
+# ─────────────────────────  WEB RISK HTTP CLIENT  ────────────────────────────
+_RETRY_ANY  = {429, 500, 502, 503, 504}     # safe to repeat a GET on these
+_RETRY_POST = {429, 503}                    # request was not processed
+
+_session: requests.Session | None = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+def _http() -> requests.Session:
+    """Keep-alive session shared by every thread of this worker process."""
+    global _session, _session_pid
+    if _session is None or _session_pid != os.getpid():   # never reuse across fork
+        with _session_lock:
+            if _session is None or _session_pid != os.getpid():
+                s = requests.Session()
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=WEBRISK_POOL_SIZE)
+                s.mount("https://", adapter)
+                s.mount("http://", adapter)             # local stand-ins
+                _session, _session_pid = s, os.getpid()
+    return _session
+
+def _retry_delay(attempt: int, resp: requests.Response | None = None) -> float:
+    """Honor Retry-After when given, else full-jitter exponential backoff."""
+    hint = resp.headers.get("Retry-After") if resp is not None else None
+    if hint:
+        try:
+            delay = float(hint)
+        except ValueError:
+            try:
+                when  = parsedate_to_datetime(hint)
+                delay = (when - datetime.now(timezone.utc)).total_seconds()
+            except (TypeError, ValueError):
+                delay = None
+        if delay is not None:
+            return min(max(delay, 0), WEBRISK_MAX_BACKOFF)
+    return random.uniform(0, min(WEBRISK_BACKOFF * 2 ** attempt, WEBRISK_MAX_BACKOFF))
+
+def webrisk_call(method: str, path: str, headers: dict,
+                 payload: dict | None = None,
+                 params: dict | None = None,
+                 wait: float | None = None,
+                 deadline_at: float | None = None) -> requests.Response:
+    """
+    Call WEBRISK_API/|path| through the pooled session. 429/5xx and
+    connection failures are retried up to WEBRISK_RETRIES times; POSTs only
+    when Web Risk can't have acted on them (429/503, connect errors).
+    Every attempt takes a slot of the shared quota ("submit" for POSTs,
+    "status" otherwise), queueing up to |wait| seconds before QuotaTimeout.
+    With |deadline_at| (time.monotonic()), quota waits, backoff sleeps and
+    read timeouts are cut to the time left, and no retry starts past it.
+    """
+    url = f"{WEBRISK_API}/{path}"
+    retry_on = _RETRY_ANY if method == "GET" else _RETRY_POST
+    budget   = "submit" if method == "POST" else "status"
+    if wait is None:
+        wait = QUOTA_SUBMIT_WAIT if budget == "submit" else QUOTA_STATUS_WAIT
+
+    def out_of_time(delay: float = 0) -> bool:
+        return deadline_at is not None and time.monotonic() + delay >= deadline_at
+
+    for attempt in range(WEBRISK_RETRIES + 1):
+        last = attempt == WEBRISK_RETRIES
+        left = _time_left(deadline_at)
+        try:
+            QUOTA_WAIT.observe(quota.acquire(budget, wait if left is None else min(wait, left)),
+                               budget)
+        except QuotaTimeout:
+            QUOTA_REFUSED.inc(budget)
+            raise
+        read_timeout = WEBRISK_READ_TIMEOUT
+        if deadline_at is not None:     # never wait on Web Risk past the caller's deadline
+            read_timeout = max(min(read_timeout, _time_left(deadline_at)), 0.05)
+        try:
+            UPSTREAM_INFLIGHT.inc()
+            start = time.perf_counter()
+            try:
+                with timed("webrisk"):
+                    resp = _http().request(
+                        method, url, headers=headers, json=payload, params=params,
+                        timeout=(WEBRISK_CONNECT_TIMEOUT, read_timeout),
+                    )
+                UPSTREAM_TOTAL.inc(method, str(resp.status_code))
+            except requests.RequestException:
+                UPSTREAM_TOTAL.inc(method, "error")
+                raise
+            finally:
+                UPSTREAM_INFLIGHT.dec()
+                UPSTREAM_SECONDS.observe(time.perf_counter() - start, method)
+        except requests.ConnectTimeout:
+            delay = _retry_delay(attempt)
+            if last or out_of_time(delay):
+                raise
+            time.sleep(delay)
+            continue
+        except (requests.ConnectionError, requests.Timeout):
+            delay = _retry_delay(attempt)
+            if last or method != "GET" or out_of_time(delay):
+                raise
+            time.sleep(delay)
+            continue
+
+        if resp.status_code in retry_on and not last:
+            delay = _retry_delay(attempt, resp)
+            if resp.status_code == 429:
+                quota.backoff(budget, delay)    # the other workers slow down too
+            if out_of_time(delay):
+                return resp                     # caller sees the 429/5xx as is
+            time.sleep(delay)
+            continue
+        return resp
+
+class RateLimiter:
+    """Token bucket allowing |rate| calls per second, bursts up to |burst|."""
+
+    def __init__(self, rate: float, burst: float | None = None):
+        self.rate   = rate
+        self.burst  = burst or max(rate, 1)
+        self._tokens = self.burst
+        self._last   = time.monotonic()
+        self._lock   = threading.Lock()
+
+    def acquire(self):
+        """Block until a call is allowed (callers queue up by reserving)."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+            self._last   = now
+            self._tokens -= 1
+            wait_for = -self._tokens / self.rate if self._tokens < 0 else 0
+        if wait_for:
+            time.sleep(wait_for)
+
+# ─────────────────────────  STATUS FETCHING  ─────────────────────────────────
+# one pool per worker: caps the fan-out even when several pages load at once
+_status_pool = ThreadPoolExecutor(max_workers=STATUS_FANOUT,
+                                  thread_name_prefix="wr-status")
+
+def _get_status(name: str, headers: dict, deadline_at: float | None = None) -> dict:
+    r = webrisk_call("GET", name, headers, deadline_at=deadline_at)
+    r.raise_for_status()
+    return r.json()
+
+def _list_statuses(project: str, wanted: set[str], headers: dict,
+                   deadline_at: float | None = None) -> dict:
+    """
+    Page through |project|/operations until every name in |wanted| has been
+    seen or the page budget ran out. Returns {name: operation json}.
+
+    The listing is sequential and covers the project's whole Web Risk
+    history, so it only reads the pages |wanted| could fill plus one
+    (recent unsettled ops sit near the top); names it missed go to GETs.
+    """
+    budget = min(STATUS_LIST_MAX_PAGES, math.ceil(len(wanted) / STATUS_LIST_PAGE_SIZE) + 1)
+    found, page_token = {}, None
+    for _ in range(budget):
+        params = {"pageSize": STATUS_LIST_PAGE_SIZE}
+        if page_token:
+            params["pageToken"] = page_token
+        r = webrisk_call("GET", f"{project}/operations", headers, params=params,
+                         deadline_at=deadline_at)
+        r.raise_for_status()
+        body = r.json()
+        for op in body.get("operations", []):
+            if op.get("name") in wanted:
+                found[op["name"]] = op
+        page_token = body.get("nextPageToken")
+        if not page_token or len(found) == len(wanted):
+            break
+    return found
+
+def _time_left(deadline_at: float | None) -> float | None:
+    return None if deadline_at is None else max(0, deadline_at - time.monotonic())
+
+def iter_statuses(names: list[str], headers: dict,
+                  deadline: float | None = STATUS_DEADLINE):
+    """
+    Fetch the Web Risk status of |names| with at most STATUS_FANOUT calls
+    in flight, yielding (name, json | Exception) as each one lands. Names
+    whose call did not finish within |deadline| seconds are never yielded
+    (None = wait for all).
+
+    Projects with at least STATUS_LIST_MIN names are read with the paginated
+    projects/{number}/operations list call (a few pages at most, see
+    _list_statuses()); only names missing from the listing fall back to
+    one GET each.
+    """
+    deadline_at = None if deadline is None else time.monotonic() + deadline
+
+    by_project = {}
+    for n in names:
+        by_project.setdefault(parent_of(n), []).append(n)
+
+    pending = {}                    # future → (project, names) | name
+    for project, ns in by_project.items():
+        if project.startswith("projects/") and len(ns) >= STATUS_LIST_MIN:
+            pending[_status_pool.submit(_list_statuses, project, set(ns), headers,
+                                        deadline_at)] = (project, ns)
+        else:
+            for n in ns:
+                pending[_status_pool.submit(_get_status, n, headers, deadline_at)] = n
+
+    try:
+        while pending:
+            done, _ = wait(pending, timeout=_time_left(deadline_at),
+                           return_when=FIRST_COMPLETED)
+            if not done:
+                break                           # deadline hit
+            for f in done:
+                what = pending.pop(f)
+                if isinstance(what, tuple):     # a project listing
+                    project, ns = what
+                    try:
+                        found = f.result()
+                    except Exception as exc:    # per-op GETs cover it
+                        log("operations listing failed", "WARNING",
+                            project=project, error=str(exc))
+                        found = {}
+                    for n in ns:
+                        if n in found:
+                            yield n, found[n]
+                        else:
+                            pending[_status_pool.submit(_get_status, n, headers,
+                                                        deadline_at)] = n
+                    continue
+                try:
+                    result = f.result()
+                except Exception as exc:
+                    result = exc
+                yield what, result
+    finally:
+        for f in pending:
+            f.cancel()              # drop queued calls, running ones finish alone
+
+def fetch_statuses(names: list[str], headers: dict,
+                   deadline: float | None = STATUS_DEADLINE) -> dict:
+    """iter_statuses() collected into {name: json | Exception}."""
+    return dict(iter_statuses(names, headers, deadline))
+
+# ─────────────────────────  BACKGROUND REFRESHER  ────────────────────────────
+def _owner() -> str:
+    """Lease owner id; evaluated per call since a preloaded app forks after import."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+def _next_delay(poll_count: int) -> timedelta:
+    """Exponential backoff: BASE, 2·BASE, 4·BASE … capped at REFRESH_MAX_DELAY."""
+    return timedelta(seconds=min(REFRESH_BASE_DELAY * 2 ** poll_count,
+                                 REFRESH_MAX_DELAY))
+
+def _claim(ref, owner: str) -> dict | None:
+    """
+    Take a lease on one due operation inside a transaction so that other
+    workers / instances skip it. Returns the document, or None if it is no
+    longer due or somebody else holds a live lease.
+    """
+    @firestore.transactional
+    def claim(txn):
+        data = ref.get(transaction=txn).to_dict() or {}
+        now  = datetime.now(timezone.utc)
+        due  = data.get("nextPoll")
+        held = data.get("leaseUntil")
+        if data.get("state") in TERMINAL_STATES or due is None or due > now:
+            return None
+        if held and held > now and data.get("leaseOwner") != owner:
+            return None
+        txn.update(ref, {
+            "leaseOwner": owner,
+            "leaseUntil": now + timedelta(seconds=REFRESH_LEASE),
+        })
+        return data
+
+    return claim(get_db().transaction())
+
+def refresh_due_operations(owner: str | None = None) -> int:
+    """
+    One refresher pass: claim up to REFRESH_BATCH operations whose nextPoll
+    has passed, poll them on Web Risk and write state + next poll time back.
+    Returns the number of operations polled.
+    """
+    owner = owner or _owner()
+    now = datetime.now(timezone.utc)
+    due = (
+        get_db().collection(COLL)
+        .where("nextPoll", "<=", now)
+        .order_by("nextPoll")
+        .limit(REFRESH_BATCH)
+        .stream()
+    )
+    claimed = {}
+    for d in due:
+        data = _claim(d.reference, owner)
+        if data and data.get("name"):
+            claimed[data["name"]] = (d.reference, data)
+    if not claimed:
+        return 0
+
+    headers  = {"Authorization": f"Bearer {get_access_token()}"}
+    statuses = fetch_statuses(list(claimed), headers, deadline=None)
+
+    now     = datetime.now(timezone.utc)
+    batch   = get_db().batch()
+    changed = []
+    for name, (ref, data) in claimed.items():
+        polls  = data.get("pollCount", 0)
+        update = {
+            "pollCount":  polls + 1,
+            "nextPoll":   now + _next_delay(polls),
+            "leaseOwner": None,
+            "leaseUntil": None,
+        }
+        result = statuses.get(name)
+        if isinstance(result, dict):
+            meta  = result.get("metadata", {})
+            state = meta.get("state", "UNKNOWN")
+            update.update({
+                "state":      state,
+                "createTime": meta.get("createTime"),
+                "lastPolled": now,
+            })
+            if state in TERMINAL_STATES:
+                update["nextPoll"] = None       # never polled again
+            if state != data.get("state"):
+                update["stateChanged"] = now
+                changed.append((ref.id, state, meta.get("createTime")))
+        else:
+            log("refresh failed", "WARNING", operation=name,
+                error=str(result))                    # retried after backoff
+        batch.update(ref, update)
+    batch.commit()
+    for doc_id, state, create_time in changed:
+        live.publish(doc_id, state, create_time)
+    return len(claimed)
+
+def run_refresher(interval: float = REFRESH_INTERVAL,
+                  stop: threading.Event | None = None):
+    """Run refresher passes every |interval| seconds until |stop| is set."""
+    stop = stop or threading.Event()
+    while not stop.is_set():
+        try:
+            n = refresh_due_operations()
+            if n:
+                log("refresher pass", operations=n)
+        except Exception as exc:
+            log("refresher pass failed", "ERROR", error=str(exc))
+        stop.wait(interval)
+
+def start_refresher() -> threading.Thread:
+    """Start run_refresher() in a daemon thread next to the Flask app."""
+    t = threading.Thread(target=run_refresher, name="wr-refresher", daemon=True)
+    t.start()
+    return t
+
+# ─────────────────────────  LIVE UPDATES  ────────────────────────────────────
+LIVE_WATCH       = os.getenv("LIVE_WATCH", "1") == "1"         # Firestore listener per worker
+LIVE_HEARTBEAT   = float(os.getenv("LIVE_HEARTBEAT", "15"))     # seconds between keep-alives
+LIVE_MAX_AGE     = float(os.getenv("LIVE_MAX_AGE", "240"))      # then the browser reconnects
+# each client holds a gunicorn thread for up to LIVE_MAX_AGE: by default only
+# half of a worker's threads may do that, the others keep serving pages
+LIVE_MAX_CLIENTS = int(os.getenv("LIVE_MAX_CLIENTS",
+                                 str(int(os.getenv("GUNICORN_THREADS", "8")) // 2)))
+LIVE_ENABLED     = REFRESH_MODE != "page" and LIVE_MAX_CLIENTS > 0   # someone publishes
+LIVE_QUEUE_SIZE  = 256                                          # events buffered per client
+LIVE_MEMORY      = 10000                                        # last states kept for dedupe
+
+def _state_class(state: str | None) -> str:
+    """CSS modifier of the state pill."""
+    return ("success" if state == "SUCCEEDED"
+            else "running" if state == "RUNNING"
+            else "closed")
+
+def _display_time(iso_ts: str | None) -> str:
+    """Web Risk createTime as shown in the table, e.g. 09 Jul 2025 16:10:21."""
+    if not iso_ts:
+        return "-"
+    dt = datetime.fromisoformat(iso_ts.replace("Z", "+00:00"))
+    return dt.strftime("%d %b %Y %H:%M:%S")
+
+class StateFeed:
+    """
+    Fans operation state changes out to /operations/stream subscribers.
+    Changes written by this worker are published directly; with LIVE_WATCH a
+    Firestore listener on |stateChanged| adds those written elsewhere (other
+    workers and instances, manage.py refresh). The listener only runs while
+    somebody is subscribed.
+    """
+
+    def __init__(self):
+        self._subs  = set()
+        self._lock  = threading.Lock()
+        self._sent  = OrderedDict()     # doc id → last state published
+        self._watch = None
+
+    def subscribe(self) -> queue.Queue | None:
+        """New subscriber queue, or None when LIVE_MAX_CLIENTS are connected."""
+        with self._lock:
+            if len(self._subs) >= LIVE_MAX_CLIENTS:
+                return None
+            sub = queue.Queue(maxsize=LIVE_QUEUE_SIZE)
+            self._subs.add(sub)
+            start = LIVE_WATCH and self._watch is None
+            if start:
+                self._watch = False     # claimed; set below
+        if start:
+            watch = self._start_watch()
+            with self._lock:
+                if self._subs:
+                    self._watch, watch = watch, None
+                else:
+                    self._watch = None  # everybody left meanwhile
+            if watch:
+                watch.unsubscribe()
+        return sub
+
+    def unsubscribe(self, sub: queue.Queue):
+        with self._lock:
+            self._subs.discard(sub)
+            watch = None
+            if not self._subs and self._watch is not False:
+                watch, self._watch = self._watch, None
+        if watch:
+            watch.unsubscribe()
+
+    def publish(self, doc_id: str, state: str | None, create_time: str | None = None):
+        """Send |state| of one operation to every subscriber, once per change."""
+        with self._lock:
+            if not self._subs:
+                return
+            if self._sent.get(doc_id) == state:
+                return
+            self._sent[doc_id] = state
+            self._sent.move_to_end(doc_id)
+            while len(self._sent) > LIVE_MEMORY:
+                self._sent.popitem(last=False)
+            subs = list(self._subs)
+        event = {"id": doc_id, "state": state, "state_class": _state_class(state),
+                 "time": _display_time(create_time)}
+        for sub in subs:
+            try:
+                sub.put_nowait(event)
+            except queue.Full:          # stalled client; it resyncs on reload
+                pass
+
+    def _start_watch(self):
+        since = datetime.now(timezone.utc)
+        try:
+            query = get_db().collection(COLL).where("stateChanged", ">", since)
+            return query.on_snapshot(self._on_snapshot)
+        except Exception as exc:        # e.g. no listen support; local changes only
+            log("state watch unavailable", "WARNING", error=str(exc))
+            return None
+
+    def _on_snapshot(self, docs, changes, read_time):
+        for change in changes:
+            if change.type.name == "REMOVED":
+                continue
+            data = change.document.to_dict() or {}
+            self.publish(change.document.id, data.get("state"), data.get("createTime"))
+
+live = StateFeed()
 
 # ────────────────────────────  shared CSS  ───────────────────────────────────
 CSS = """
@@ -210,7 +1359,8 @@ pre.json{background:var(--panel);padding:18px;border-radius:6px;overflow:auto}
 # ─────────────────────────  MAIN PAGE  ───────────────────────────────────────
 MAIN_TEMPLATE = """
 <!doctype html><html lang="en"><head><meta charset="utf-8">
-<title>Web Risk Submission Application</title>{{ css|safe }}</head><body>
+<title>Web Risk Submission Application</title>
+<link rel="stylesheet" href="{{ css_href }}"></head><body>
 <a class="top-nav" href="/operations">Operations</a>
 <div class="wrap">
   <h1>Web Risk Submission Application</h1>
@@ -333,7 +1483,7 @@ overlay.addEventListener('click', e => { if(e.target === overlay) hideModal(); }
 OPS_TEMPLATE = """
 <!doctype html><html lang="en"><head><meta charset="utf-8">
 <title>Web Risk Operations</title>
-{{ css|safe }}
+<link rel="stylesheet" href="{{ css_href }}">
 
 <!-- styles used only on the Operations page -->
 <style>
@@ -377,6 +1527,10 @@ pre.json{margin:0;background:var(--panel);padding:20px;border-radius:6px;overflo
 .pill-success{background:var(--success)}
 .pill-running{background:var(--warning)}
 .pill-closed{ background:var(--error)}
+.pill-pending{background:#7c7c8c}
+.pager td{text-align:right}
+.pager a{color:var(--text);text-decoration:none;font-weight:600;margin-left:24px}
+.pager a:hover{color:var(--accent)}
 </style>
 </head><body>
 <a class="top-nav" href="/">← Back</a>
@@ -405,7 +1559,7 @@ pre.json{margin:0;background:var(--panel);padding:20px;border-radius:6px;overflo
   <!-- ███  OPERATIONS TABLE  (right)  ███ -->
   <table class="ops-tbl">
     <thead>
-      <tr><th colspan="4">Operations status</th></tr>
+      <tr><th colspan="4">Operations status{% if pager.project %} · project {{ pager.project }}{% endif %}{% if pager.archived %} · archived{% endif %}</th></tr>
       <tr>
         <th style="width:230px">Date&nbsp;&amp;&nbsp;Time</th>
         <th>URI</th>
@@ -415,7 +1569,7 @@ pre.json{margin:0;background:var(--panel);padding:20px;border-radius:6px;overflo
     </thead>
     <tbody>
     {% for op in ops %}
-      <tr>
+      <tr data-id="{{ op.id }}">
         <td>[{{ op.time }}]</td>
         <td>{{ op.url }}</td>
         <td class="status-cell">
@@ -425,22 +1579,58 @@ pre.json{margin:0;background:var(--panel);padding:20px;border-radius:6px;overflo
             onclick="toggle({{ loop.index }})">▶</td>
       </tr>
       <tr id="p-op{{ loop.index }}" style="display:none">
-        <td colspan="4"><pre class="json">{{ op.payload }}</pre></td>
+        <td colspan="4"><pre class="json" id="pre-op{{ loop.index }}"
+                             data-id="{{ op.id }}">{{ op.error }}</pre></td>
       </tr>
     {% endfor %}
     </tbody>
+    <tfoot class="pager"><tr><td colspan="4">
+      <a href="/operations?{{ pager.other }}">{{ "Current" if pager.archived else "Archived" }}</a>
+      {% if pager.cursor %}<a href="/operations?{{ pager.scope }}">« Newest</a>{% endif %}
+      {% if pager.next %}<a href="/operations?{{ pager.scope }}cursor={{ pager.next }}">Older ›</a>{% endif %}
+    </td></tr></tfoot>
   </table>
 
 </div>  <!-- /ops-wrapper -->
 
 <script>
-function toggle(idx){
+async function toggle(idx){
   const row = document.getElementById('p-op'+idx);
   const btn = document.getElementById('btn-op'+idx);
+  const pre = document.getElementById('pre-op'+idx);
   const open = row.style.display==='table-row';
   row.style.display = open ? 'none' : 'table-row';
   btn.textContent   = open ? '▶' : '▼';
+
+  // payloads are fetched on first expand instead of shipped with the page
+  if(open || pre.textContent || !pre.dataset.id) return;
+  pre.textContent = 'Loading…';
+  try {
+    const resp = await fetch('/operations/' + pre.dataset.id + '/payload');
+    if(!resp.ok) throw new Error(await resp.text() || resp.statusText);
+    pre.textContent = JSON.stringify(await resp.json(), null, 2);
+  } catch(err){
+    pre.textContent = 'ERROR: ' + (err.message || 'request failed');
+  }
+}
+
+{% if live %}
+// state changes are pushed; listen only while some row can still change
+const UNSETTLED = '.ops-tbl .pill-running, .ops-tbl .pill-pending';
+if(window.EventSource && document.querySelector(UNSETTLED)){
+  const live = new EventSource('/operations/stream');
+  live.addEventListener('state', e => {
+    const op  = JSON.parse(e.data);
+    const row = document.querySelector('tr[data-id="' + CSS.escape(op.id) + '"]');
+    if(!row) return;
+    const pill = row.querySelector('.pill');
+    pill.className   = 'pill pill-' + op.state_class;
+    pill.textContent = op.state;
+    if(op.time !== '-') row.cells[0].textContent = '[' + op.time + ']';
+    if(!document.querySelector(UNSETTLED)) live.close();
+  });
 }
+{% endif %}
 </script>
 <div class="issue-msg">
   If you face any issues, please email
@@ -453,10 +1643,196 @@ function toggle(idx){
 
 
 
+# ───────────────────  COMPILED TEMPLATES & ASSETS  ───────────────────────────
+# shared CSS is served as a fingerprinted file the browser can keep forever
+CSS_BODY = CSS.strip().removeprefix("<style>").removesuffix("</style>").strip() + "\n"
+CSS_HREF = f"/assets/app.{hashlib.sha256(CSS_BODY.encode()).hexdigest()[:12]}.css"
+
+MAIN_TMPL = app.jinja_env.from_string(MAIN_TEMPLATE)    # parsed once per process
+OPS_TMPL  = app.jinja_env.from_string(OPS_TEMPLATE)
+MAIN_HTML = MAIN_TMPL.render(css_href=CSS_HREF)         # no per-request data
+
+COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", "500"))   # bytes
+COMPRESS_TYPES    = {"text/html", "text/css", "text/csv",
+                     "application/json", "application/x-ndjson"}
+COMPRESS_FLUSH    = int(os.getenv("COMPRESS_FLUSH", "16384"))    # bytes between forced flushes
+
+def _by_row(chunks, boundary: str = "</tr>"):
+    """Join streamed template output into one chunk per table row."""
+    buf = []
+    for chunk in chunks:
+        buf.append(chunk)
+        if boundary in chunk:           # the loop blocks on the next status right after
+            yield "".join(buf)
+            buf.clear()
+    if buf:
+        yield "".join(buf)
+
+def _gzip_stream(chunks):
+    """
+    gzip a streamed body. Sync-flushes (which cost bytes and a write each)
+    happen only where a chunk ends a line, i.e. a table row, CSV row or NDJSON
+    record, or once COMPRESS_FLUSH bytes went in unflushed, so rows still
+    trickle in without flushing every fragment.
+    """
+    z = zlib.compressobj(6, zlib.DEFLATED, 31)          # wbits 31 → gzip container
+    pending = 0
+    try:
+        for chunk in chunks:
+            raw  = chunk.encode() if isinstance(chunk, str) else chunk
+            data = z.compress(raw)
+            pending += len(raw)
+            if pending >= COMPRESS_FLUSH or raw.rstrip(b" ").endswith(b"\n"):
+                data += z.flush(zlib.Z_SYNC_FLUSH)
+                pending = 0
+            if data:
+                yield data
+        yield z.flush()
+    finally:
+        if hasattr(chunks, "close"):
+            chunks.close()
+
+@app.after_request
+def compress(response: Response) -> Response:
+    accept = request.headers.get("Accept-Encoding", "")
+    if (response.mimetype not in COMPRESS_TYPES
+            or response.status_code in (204, 304) or response.status_code < 200
+            or response.direct_passthrough
+            or "Content-Encoding" in response.headers
+            or "gzip" not in accept and "br" not in accept):
+        return response
+
+    response.vary.add("Accept-Encoding")
+    if response.is_streamed:
+        if "gzip" in accept:
+            response.response = _gzip_stream(response.response)
+            response.headers["Content-Encoding"] = "gzip"
+            response.headers.pop("Content-Length", None)
+        return response
+
+    body = response.get_data()
+    if len(body) < COMPRESS_MIN_SIZE:
+        return response
+    if brotli is not None and "br" in accept:
+        response.set_data(brotli.compress(body, quality=5))
+        response.headers["Content-Encoding"] = "br"
+    elif "gzip" in accept:
+        response.set_data(gzip.compress(body, 6))
+        response.headers["Content-Encoding"] = "gzip"
+    return response
+
+# ─────────────────────────  REQUEST TIMING  ──────────────────────────────────
+@app.before_request
+def _start_timer():
+    g.started = time.perf_counter()
+    IN_FLIGHT.inc()
+
+@app.after_request
+def _server_timing(response: Response) -> Response:
+    g.status = response.status_code
+    # streamed bodies: only the phases done before the first byte show up here,
+    # the JSON log line written at teardown has the full breakdown
+    timings = g.get("timings")
+    if timings:
+        response.headers["Server-Timing"] = ", ".join(
+            f"{phase};dur={took * 1000:.1f}" for phase, took in timings.items())
+    return response
+
+@app.teardown_request
+def _log_request(exc):
+    if "started" not in g:
+        return
+    IN_FLIGHT.dec()
+    took   = time.perf_counter() - g.started
+    route  = request.url_rule.rule if request.url_rule else "(unmatched)"
+    status = g.get("status", 500)
+    REQUEST_SECONDS.observe(took, route, request.method, str(status))
+    log("request", method=request.method, path=request.path, status=status,
+        duration_ms=round(took * 1000, 1),
+        phases={p: round(t * 1000, 1) for p, t in g.get("timings", {}).items()})
+
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    """Prometheus scrape target (summed over workers once metrics.share() ran)."""
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
 # ─────────────────────────  ROUTES  ──────────────────────────────────────────
 @app.route("/", methods=["GET"])
 def index():
-    return render_template_string(MAIN_TEMPLATE, css=CSS)
+    resp = Response(MAIN_HTML, mimetype="text/html")
+    resp.cache_control.public  = True
+    resp.cache_control.max_age = 300
+    resp.add_etag()
+    return resp.make_conditional(request)
+
+@app.route(CSS_HREF, methods=["GET"])
+def shared_css():
+    resp = Response(CSS_BODY, mimetype="text/css")
+    resp.cache_control.public    = True
+    resp.cache_control.max_age   = 31536000             # name changes with content
+    resp.cache_control.immutable = True
+    return resp
+
+def build_payload(form, uri: str) -> dict:
+    """uris:submit body for |uri| with the optional threat fields of |form|."""
+    payload = {"submission": {"uri": uri}}
+
+    # optional helpers
+    if form.get("abuseType"):
+        payload.setdefault("threatInfo", {})["abuseType"] = form["abuseType"]
+
+    score = form.get("score")
+    level = form.get("level")
+    if score:
+        payload.setdefault("threatInfo", {}).setdefault("threatConfidence", {})["score"] = float(score)
+    elif level:
+        payload.setdefault("threatInfo", {}).setdefault("threatConfidence", {})["level"] = level
+
+    labels   = form.getlist("labels")
+    comments = form.get("comments")
+    if labels or comments:
+        tj = {}
+        if labels:   tj["labels"]   = labels
+        if comments: tj["comments"] = [comments]
+        payload.setdefault("threatInfo", {})["threatJustification"] = tj
+
+    platform = form.get("platform")
+    regions  = form.get("regions")
+    if platform or regions:
+        td = {}
+        if platform: td["platform"] = platform
+        if regions:
+            td["regionCodes"] = [r.strip().upper() for r in regions.split(",") if r.strip()]
+        payload["threatDiscovery"] = td
+    return payload
+
+def _posted_token(form) -> str:
+    """Access token for the service-account key pasted in |form|."""
+    try:
+        key_info = json.loads(form["sa_key"].strip())
+    except json.JSONDecodeError:
+        raise ValueError("Service-account key is not valid JSON")
+    try:
+        return credentials_for_key(key_info).token()
+    except Exception as e:
+        raise ValueError(f"Could not use service-account key: {e}")
+
+def parse_uri_list(text: str) -> list[str]:
+    """
+    URIs from a CSV (first column, optional "uri" header) or NDJSON
+    (one "https://…" string or {"uri": …} object per line) upload.
+    """
+    lines = [l for l in text.splitlines() if l.strip()]
+    if lines and lines[0].lstrip()[:1] in ("{", '"'):
+        uris = []
+        for l in lines:
+            item = json.loads(l)
+            uris.append(item if isinstance(item, str) else item.get("uri", ""))
+    else:
+        uris = [row[0] for row in csv.reader(lines) if row]
+        if uris and uris[0].strip().lower() == "uri":
+            uris = uris[1:]
+    return [u.strip() for u in uris if u and u.strip()]
 
 @app.route("/submit", methods=["POST"])
 def submit():
@@ -467,146 +1843,449 @@ def submit():
             return "project number and uri are required", 400
 
         parent  = f"projects/{proj_num}"
-        payload = {"submission": {"uri": uri}}
-
-        # optional helpers
-        if request.form.get("abuseType"):
-            payload.setdefault("threatInfo", {})["abuseType"] = request.form["abuseType"]
-
-        score = request.form.get("score")
-        level = request.form.get("level")
-        if score:
-            payload.setdefault("threatInfo", {}).setdefault("threatConfidence", {})["score"] = float(score)
-        elif level:
-            payload.setdefault("threatInfo", {}).setdefault("threatConfidence", {})["level"] = level
-
-        labels   = request.form.getlist("labels")
-        comments = request.form.get("comments")
-        if labels or comments:
-            tj = {}
-            if labels:   tj["labels"]   = labels
-            if comments: tj["comments"] = [comments]
-            payload.setdefault("threatInfo", {})["threatJustification"] = tj
-
-        platform = request.form.get("platform")
-        regions  = request.form.get("regions")
-        if platform or regions:
-            td = {}
-            if platform: td["platform"] = platform
-            if regions:
-                td["regionCodes"] = [r.strip().upper() for r in regions.split(",") if r.strip()]
-            payload["threatDiscovery"] = td
-
-        # print payload
-        print("\nPayload sent to Web Risk API:")
-        print(json.dumps(payload, indent=2), "\n")
-
-
-        # NEW — build creds from the posted service-account key
-        sa_key_raw = request.form["sa_key"].strip()
-        try:
-            key_info = json.loads(sa_key_raw)
-        except json.JSONDecodeError:
-            return "Service-account key is not valid JSON", 400
 
+        # NEW — build creds from the posted service-account key; checked
+        # before dedupe so a bad key never gets an operation back
         try:
-            creds = service_account.Credentials.from_service_account_info(
-                key_info, scopes=SCOPES
-            )
-            creds.refresh(GoogleRequest())
-        except Exception as e:
-            return f"Could not use service-account key: {e}", 400
-
-        token = creds.token
-
-        resp = requests.post(
-            f"https://webrisk.googleapis.com/v1/{parent}/uris:submit",
-            headers={
-                "Authorization": f"Bearer {token}",
-                "Content-Type": "application/json",
-            },
-            data=json.dumps(payload),
-            timeout=20,
+            token = _posted_token(request.form)
+        except ValueError as e:
+            return str(e), 400
+
+        # resubmission inside DEDUPE_WINDOW → hand back the existing operation
+        existing = find_duplicate(parent, uri)
+        if existing:
+            return jsonify({"name": existing, "duplicate": True})
+
+        payload = build_payload(request.form, uri)
+
+        log("payload sent to Web Risk API", payload=payload)
+
+        resp = webrisk_call(
+            "POST", f"{parent}/uris:submit",
+            headers={"Authorization": f"Bearer {token}"},
+            payload=payload,
         )
 
         resp.raise_for_status()
         result = resp.json()
 
-        # append operation name
+        # persisted in the background; the user only waits for Web Risk
         op_name = result.get("name")
         if op_name:
-            with open("operations", "a", encoding="utf-8") as f:
-                f.write(op_name + "\n")
-                save_operation(op_name, uri, payload)
+            meta = result.get("metadata", {})
+            remember_submission(parent, uri, op_name)
+            outbox.put((op_name, uri, payload, meta.get("state"), meta.get("createTime")))
 
         return jsonify(result)
+    except QuotaTimeout as exc:                 # queued as long as we could
+        return str(exc), 429, {"Retry-After": str(int(exc.retry_after) + 1)}
     except Exception as exc:
         return str(exc), 400
 
-@app.route("/operations", methods=["GET"])
-def operations_page():
-    path = pathlib.Path("operations")
-    if not path.exists():
-        return "'operations' file not found", 404
-
-    token   = get_access_token()
-    # creds, _ = google.auth.default(scopes=SCOPES)
-    # creds.refresh(google.auth.transport.requests.Request())
-    # token = creds.token
-    headers = {"Authorization": f"Bearer {token}"}
-    ops_out = []
-
-    for name in list_operations():          # names from Firestore helper
-        if not name:
-            continue
+@app.route("/submit/batch", methods=["POST"])
+def submit_batch():
+    """
+    Submit a CSV / NDJSON list of URIs (file field "file" or text field
+    "uris") that share the threat fields of the single-URI form. Results
+    are streamed back as NDJSON, one line per URI as it completes; accepted
+    operations go through the outbox like single submits.
+    """
+    proj_num = request.form.get("parent", "").strip()
+    upload   = request.files.get("file")
+    text     = upload.read().decode("utf-8-sig") if upload else request.form.get("uris", "")
+    if not proj_num or not text.strip():
+        return "project number and a list of uris are required", 400
+    try:
+        uris = parse_uri_list(text)
+    except (ValueError, AttributeError) as e:
+        return f"Could not parse uri list: {e}", 400
+    if not uris:
+        return "no uris found in the list", 400
+    if len(uris) > BATCH_MAX_URIS:
+        return f"at most {BATCH_MAX_URIS} uris per batch", 400
+
+    seen, unique, invalid = set(), [], []   # same URI twice in one list
+    for u in uris:
         try:
-            # status from Web Risk
-            r = requests.get(f"https://webrisk.googleapis.com/v1/{name}",
-                             headers=headers, timeout=20)
-            r.raise_for_status()
-            data = r.json()
-
-            # additional info from Firestore document
-            doc = db.collection(COLL).document(_doc_id(name)).get()
-            doc_data = doc.to_dict() or {}
-            url      = doc_data.get("url", "(unknown)")
-            payload  = json.dumps(doc_data.get("payload", {}), indent=2)
-
-            meta   = data.get("metadata", {})
-            iso_ts = meta.get("createTime")
-            time_str = "-"
-            if iso_ts:
-              dt = datetime.fromisoformat(iso_ts.replace("Z", "+00:00"))
-              # Example: 09 Jul 2025 16:10:21
-              time_str = dt.strftime("%d %b %Y %H:%M:%S")
-
+            key = normalize_uri(u)
+        except ValueError as e:             # e.g. a port that is not a number
+            invalid.append((u, str(e)))
+            continue
+        if key not in seen:
+            seen.add(key)
+            unique.append(u)
+    repeated, uris = len(uris) - len(unique) - len(invalid), unique
 
-            state = meta.get("state", "UNKNOWN")
-            state_class = ("success" if state == "SUCCEEDED"
-                           else "running" if state == "RUNNING"
-                           else "closed")
+    try:
+        token    = _posted_token(request.form)
+        payloads = [build_payload(request.form, u) for u in uris]
+    except ValueError as e:
+        return str(e), 400
 
-            ops_out.append({
-                "time": time_str,
+    parent  = f"projects/{proj_num}"
+    headers = {"Authorization": f"Bearer {token}"}
+    limiter = RateLimiter(BATCH_RATE)
+
+    def submit_one(uri: str, payload: dict) -> dict:
+        existing = find_duplicate(parent, uri)
+        if existing:
+            return {"name": existing, "duplicate": True}
+        limiter.acquire()
+        resp = webrisk_call("POST", f"{parent}/uris:submit", headers, payload=payload)
+        resp.raise_for_status()
+        return resp.json()
+
+    def record(uri: str, payload: dict, result: dict):
+        if result.get("name") and not result.get("duplicate"):
+            meta = result.get("metadata", {})
+            remember_submission(parent, uri, result["name"])
+            outbox.put((result["name"], uri, payload,
+                        meta.get("state"), meta.get("createTime")))
+
+    def generate():
+        failed = len(invalid)
+        for uri, error in invalid:
+            yield json.dumps({"uri": uri, "error": error}) + "\n"
+        pool    = ThreadPoolExecutor(max_workers=BATCH_CONCURRENCY)
+        futures = {pool.submit(submit_one, u, p): (u, p) for u, p in zip(uris, payloads)}
+        try:
+            for f in as_completed(futures):
+                uri, payload = futures.pop(f)
+                try:
+                    result = f.result()
+                except Exception as exc:
+                    failed += 1
+                    yield json.dumps({"uri": uri, "error": str(exc)}) + "\n"
+                    continue
+
+                record(uri, payload, result)
+                line = {"uri": uri, "name": result.get("name"),
+                        "state": result.get("metadata", {}).get("state")}
+                if result.get("duplicate"):
+                    line["duplicate"] = True
+                yield json.dumps(line) + "\n"
+        finally:
+            # client went away mid-stream: stop queued submits, but still
+            # record the ones Web Risk already accepted
+            for f in list(futures):
+                if f.cancel():
+                    continue
+                uri, payload = futures[f]
+                try:
+                    record(uri, payload, f.result())
+                except Exception:
+                    continue
+            pool.shutdown()
+        yield json.dumps({"done": len(uris) + len(invalid), "failed": failed,
+                          "repeated": repeated}) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+def _operation_rows(cursor: str | None, pager: dict,
+                    page_size: int = OPS_PAGE_SIZE, **filters):
+    """
+    Yield the /operations table rows (newest first), each one as soon as its
+    state is known. pager["next"] is set to the next page's cursor and
+    pager["settled"] to the number of states written back. |filters| go to
+    list_operation_records().
+    """
+    settled = []                                # newly terminal → write back
+
+    with timed("firestore"):
+        records = list_operation_records(page_size, cursor, **filters)
+    if len(records) == page_size:
+        pager["next"] = records[-1]["id"]
+    records = [r for r in records if r["name"]]
+    to_poll = []
+    if REFRESH_MODE == "page":                  # otherwise the refresher does it
+        to_poll = [r["name"] for r in records if r["state"] not in TERMINAL_STATES]
+
+    statuses = iter(())
+    if to_poll:                                 # skip the token when all cached
+        token   = get_access_token()
+        # creds, _ = google.auth.default(scopes=SCOPES)
+        # creds.refresh(google.auth.transport.requests.Request())
+        # token = creds.token
+        headers = {"Authorization": f"Bearer {token}"}
+        statuses = iter_statuses(to_poll, headers)
+
+    polling = set(to_poll)
+    arrived = {}
+    for rec in records:
+        name = rec["name"]
+        if name in polling and name not in arrived:
+            with timed("webrisk"):
+                for polled, result in statuses: # wait until this row's status lands
+                    arrived[polled] = result
+                    if polled == name:
+                        break
+        try:
+            url = rec["url"]
+
+            # no quota slot before the deadline: same as missing the deadline
+            if name in arrived and not isinstance(arrived[name], QuotaTimeout):
+                data = arrived[name]                    # polled just now
+                if isinstance(data, Exception):
+                    raise data
+
+                meta   = data.get("metadata", {})
+                iso_ts = meta.get("createTime")
+                state  = meta.get("state", "UNKNOWN")
+                if state in TERMINAL_STATES:
+                    settled.append((name, state, iso_ts))
+            elif rec["state"] in TERMINAL_STATES or (
+                    rec["state"] and REFRESH_MODE != "page"):
+                state, iso_ts = rec["state"], rec["createTime"]   # cached
+            else:                       # missed the page deadline / not polled yet
+                yield {
+                    "id": rec["id"],
+                    "name": name,
+                    "time": "-",
+                    "url": url,
+                    "state": "PENDING REFRESH",
+                    "state_class": "pending",
+                    "payload": rec.get("payload")
+                }
+                continue
+
+            row = {
+                "id": rec["id"],
+                "name": name,
+                "time": _display_time(iso_ts),
+                "createTime": iso_ts,
                 "url": url,
-                "payload": payload,
                 "state": state,
-                "state_class": state_class
-            })
+                "state_class": _state_class(state),
+                "payload": rec.get("payload")
+            }
 
         except Exception as exc:
-            ops_out.append({
+            row = {
+                "id": rec["id"],
+                "name": name,
                 "time": "-",
                 "url": name,
-                "payload": f"ERROR: {exc}",
+                "error": f"ERROR: {exc}",
                 "state": "ERROR",
-                "state_class": "closed"
-            })
+                "state_class": "closed",
+                "payload": rec.get("payload")
+            }
+        yield row
+
+    if settled:
+        try:
+            save_operation_states(settled)
+            pager["settled"] = len(settled)
+        except Exception as exc:                # cache miss next time, not fatal
+            log("could not persist terminal states", "WARNING", error=str(exc))
+
+def _parse_time(value: str | None) -> datetime | None:
+    """ISO date or date-time from a query string; naive means UTC."""
+    if not value:
+        return None
+    when = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return when if when.tzinfo else when.replace(tzinfo=timezone.utc)
+
+def _project_filter() -> str | None:
+    """projects/{number} from ?project=, so a tenant only reads and polls its own."""
+    project = request.args.get("project", "").strip()
+    if not project:
+        return None
+    if not project.isdigit():
+        raise ValueError("project must be a project number")
+    return f"projects/{project}"
 
-    return render_template_string(OPS_TEMPLATE, css=CSS, ops=ops_out)
+@app.route("/operations", methods=["GET"])
+def operations_page():
+    cursor   = request.args.get("cursor") or None
+    archived = request.args.get("archived") == "1"      # opt-in, paged separately
+    try:
+        parent = _project_filter()
+    except ValueError as e:
+        return str(e), 400
+    scope  = {k: v for k, v in (("project", parent and parent.split("/")[1]),
+                                ("archived", archived and "1")) if v}
+    pager  = {"cursor": cursor, "next": None,   # "next" filled in while rendering
+              "project": scope.get("project"), "archived": archived,
+              "scope": urlencode(scope) + "&" if scope else "",
+              "other": urlencode({k: v for k, v in scope.items() if k != "archived"}
+                                 if archived else {**scope, "archived": "1"})}
+    rows   = _operation_rows(cursor, pager, parent=parent, archived=archived)
+
+    # streamed: header + legend go out at once, each <tr> when its status lands
+    if request.args.get("stream", "1" if OPS_STREAM else "0") == "1":
+        return Response(stream_with_context(
+            _by_row(OPS_TMPL.generate(css_href=CSS_HREF, ops=rows, pager=pager,
+                                      live=LIVE_ENABLED))))
+    ops = list(rows)
+    with timed("render"):
+        return OPS_TMPL.render(css_href=CSS_HREF, ops=ops, pager=pager, live=LIVE_ENABLED)
+
+@app.route("/api/operations", methods=["GET"])
+def api_operations():
+    """
+    The /operations records as JSON, newest first. ?state=RUNNING[,…],
+    ?since=<ISO time> and ?project= filter, ?limit= / ?cursor= page,
+    ?archived=1 reads the archive instead. ?state= applies to the stored
+    state; rows whose poll did not land (PENDING REFRESH, ERROR) are kept
+    so no match is skipped between pages. The ETag is the
+    collection version, so an unchanged If-None-Match gets a 304 without a
+    listing query or any Web Risk call. With REFRESH_MODE=page states only
+    move when a full load polls them, so the 304 shortcut is then taken
+    only while every stored operation is settled.
+    """
+    try:
+        states = [s.strip().upper() for s in request.args.get("state", "").split(",")
+                  if s.strip()] or None
+        since  = _parse_time(request.args.get("since"))
+        limit  = min(int(request.args.get("limit", OPS_PAGE_SIZE)), API_MAX_LIMIT)
+        parent = _project_filter()
+        archived = request.args.get("archived") == "1"
+    except ValueError as e:
+        return f"bad query parameter: {e}", 400
+    if limit < 1:
+        return "limit must be positive", 400
+    if states and len(states) > 30:                     # Firestore "in" limit
+        return "at most 30 states", 400
+    cursor = request.args.get("cursor") or None
+
+    with timed("firestore"):
+        version = collection_version()
+        current = REFRESH_MODE != "page" or archived or not has_unsettled()
+    if current and request.if_none_match.contains(version):
+        resp = Response(status=304)
+    else:
+        pager = {"cursor": cursor, "next": None, "settled": 0}
+        rows  = [
+            {k: row.get(k) for k in ("id", "name", "time", "createTime", "url",
+                                     "state", "payload", "error") if k in row}
+            for row in _operation_rows(cursor, pager, limit, states=states, since=since,
+                                       parent=parent, fields=LIST_FIELDS + ["payload"],
+                                       archived=archived)
+        ]
+        if states:                              # a live poll may have moved it on;
+            rows = [r for r in rows             # unpolled rows keep their match
+                    if r["state"] in states or r["state"] in ("PENDING REFRESH", "ERROR")]
+        if pager["settled"]:                    # this request changed the collection
+            with timed("firestore"):
+                version = collection_version()
+        resp = jsonify({"operations": rows, "next": pager["next"]})
+    resp.set_etag(version)
+    resp.cache_control.no_cache = True                  # always revalidate
+    return resp
+
+EXPORT_PAGE_SIZE = int(os.getenv("EXPORT_PAGE_SIZE", "1000"))    # docs per Firestore read
+EXPORT_CHUNK     = 64 * 1024                                    # bytes per flushed chunk
+EXPORT_COLUMNS   = ["created", "name", "parent", "url", "state", "createTime",
+                    "lastPolled", "archived", "payload"]
+
+@app.route("/operations/export", methods=["GET"])
+def export_operations():
+    """
+    Every stored operation with |created| in [?from, ?to) as ?format=csv or
+    ndjson, newest first, hot and archived merged. Rows are streamed page by
+    page from Firestore: constant memory, no Web Risk calls.
+    """
+    fmt = request.args.get("format", "csv")
+    if fmt not in ("csv", "ndjson"):
+        return "format must be csv or ndjson", 400
+    try:
+        start  = _parse_time(request.args.get("from"))
+        end    = _parse_time(request.args.get("to"))
+        parent = _project_filter()
+    except ValueError as e:
+        return f"bad query parameter: {e}", 400
+
+    def records(archived: bool):
+        for rec in iter_operation_records(EXPORT_PAGE_SIZE, since=start, until=end,
+                                          parent=parent, archived=archived,
+                                          fields=LIST_FIELDS + ["parent", "payload"]):
+            rec["archived"] = archived
+            yield rec
+
+    def generate():
+        rows = heapq.merge(records(False), records(True),
+                           key=lambda r: r["created"], reverse=True)
+        out  = io.StringIO()
+        writer = csv.writer(out) if fmt == "csv" else None
+        if writer:
+            writer.writerow(EXPORT_COLUMNS)
+        count = 0
+        for rec in rows:
+            row = {k: rec.get(k) for k in EXPORT_COLUMNS}
+            for k in ("created", "lastPolled"):
+                row[k] = row[k] and row[k].isoformat()
+            if writer:
+                row["payload"] = json.dumps(row["payload"], separators=(",", ":"))
+                writer.writerow(row.values())
+            else:
+                out.write(json.dumps(row, default=str) + "\n")
+            count += 1
+            if out.tell() >= EXPORT_CHUNK:
+                yield out.getvalue()
+                out.seek(0)
+                out.truncate()
+        yield out.getvalue()
+        log("export finished", format=fmt, rows=count, project=parent)
+
+    name = "operations-{}-{}.{}".format((start and start.date()) or "start",
+                                        (end and end.date()) or "now", fmt)
+    return Response(stream_with_context(generate()),
+                    mimetype="text/csv" if fmt == "csv" else "application/x-ndjson",
+                    headers={"Content-Disposition": f'attachment; filename="{name}"'})
+
+@app.route("/operations/<op_id>/payload", methods=["GET"])
+def operation_payload(op_id: str):
+    """Payload of one stored operation, fetched by the ▶ toggle on demand."""
+    with timed("firestore"):
+        doc = get_db().collection(COLL).document(op_id).get(field_paths=["payload"])
+        if not doc.exists:                      # moved by archive_operations()
+            doc = get_db().collection(ARCHIVE_COLL).document(op_id).get(field_paths=["payload"])
+    if not doc.exists:
+        return "operation not found", 404
+    return jsonify((doc.to_dict() or {}).get("payload", {}))
+
+@app.route("/operations/stream", methods=["GET"])
+def operations_stream():
+    """
+    Server-Sent Events: one "state" event per operation state change, so the
+    /operations page patches its pills in place instead of being reloaded.
+    Only offered when a refresher (REFRESH_MODE thread / external) writes
+    the state changes; in "page" mode nothing would ever be sent.
+    """
+    if not LIVE_ENABLED:
+        return "live updates need REFRESH_MODE=thread or external", 404
+    sub = live.subscribe()
+    if sub is None:
+        return "too many live clients", 503
 
+    def generate():
+        try:
+            yield "retry: 5000\n\n"
+            ends = time.monotonic() + LIVE_MAX_AGE          # frees the worker thread
+            while (left := ends - time.monotonic()) > 0:
+                try:
+                    event = sub.get(timeout=min(LIVE_HEARTBEAT, left))
+                except queue.Empty:
+                    yield ": keep-alive\n\n"                # also detects gone clients
+                    continue
+                yield f"event: state\ndata: {json.dumps(event)}\n\n"
+        finally:
+            live.unsubscribe(sub)
+
+    resp = Response(generate(), mimetype="text/event-stream")
+    resp.headers["Cache-Control"]     = "no-cache"
+    resp.headers["X-Accel-Buffering"] = "no"
+    return resp
+
+
+# under gunicorn the refresher thread is started per worker by post_fork
+# (see gunicorn.conf.py) — threads don't survive the fork of a preloaded app
 
 # ──────────────────────────────────────────────────────────────────────────────
 if __name__ == "__main__":
+    outbox.start()
+    if REFRESH_MODE == "thread":
+        start_refresher()
     app.run(debug=True, port=8080)
 
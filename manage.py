@@ -0,0 +1,183 @@
+"""
+Command-line jobs for the Web Risk submitter.
+
+    python manage.py refresh            # poll RUNNING operations forever
+    python manage.py refresh --once     # single pass (Cloud Run job)
+    python manage.py backfill-parent    # add "parent" to documents written before it existed
+    python manage.py copy operations qpost-operations [--backfill]
+    python manage.py copy qpost-operations qpost-operations --backfill   # in place
+    python manage.py archive --days 30  # move long-settled operations to the archive
+"""
+import argparse
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import main
+
+
+def cmd_refresh(args):
+    if args.once:
+        print(f"polled {main.refresh_due_operations()} operation(s)")
+    else:
+        main.run_refresher(args.interval)
+
+
+def cmd_backfill_parent(args):
+    """Derive |parent| from the stored operation name, page by page."""
+    coll   = main.get_db().collection(main.COLL)
+    query  = coll.order_by("__name__").select(["name", "parent"]).limit(args.page_size)
+    last   = None
+    seen = updated = skipped = 0
+    while True:
+        page = list((query.start_after(last) if last else query).stream())
+        if not page:
+            break
+        batch, pending = main.get_db().batch(), 0
+        for doc in page:
+            data = doc.to_dict() or {}          # snapshot.get() raises on missing fields
+            name = data.get("name")
+            if not name or not name.startswith("projects/"):
+                skipped += 1                    # legacy hash docs without a name
+            elif data.get("parent") != main.parent_of(name):
+                batch.update(doc.reference, {"parent": main.parent_of(name)})
+                pending += 1
+        if pending and not args.dry_run:
+            batch.commit()
+        seen, updated, last = seen + len(page), updated + pending, page[-1]
+        print(f"\r{seen} scanned, {updated} updated, {skipped} skipped", end="", flush=True)
+    print()
+
+
+def cmd_archive(args):
+    moved = main.archive_operations(main.timedelta(days=args.days), dry_run=args.dry_run)
+    verb  = "would move" if args.dry_run else "moved"
+    print(f"{verb} {moved} operation(s) {main.COLL} → {main.ARCHIVE_COLL}")
+
+
+def _load_checkpoint(path: str, source: str, target: str) -> dict:
+    try:
+        with open(path) as f:
+            state = json.load(f)
+    except FileNotFoundError:
+        return {"source": source, "target": target, "last": None, "copied": 0}
+    if (state.get("source"), state.get("target")) != (source, target):
+        raise SystemExit(f"{path} belongs to a copy of {state.get('source')} → "
+                         f"{state.get('target')}; pass --checkpoint or --restart")
+    return state
+
+
+def _save_checkpoint(path: str, state: dict):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp, path)                       # never a half-written checkpoint
+
+
+def cmd_copy(args):
+    """
+    Copy |source| to |target| page by page in document-ID order. Pages are
+    committed by |workers| threads; the checkpoint only advances past pages
+    whose batch and every earlier one are committed, so a restart resumes
+    without gaps (re-copying a page is harmless).
+    """
+    db, in_place = main.get_db(), args.source == args.target
+    if not 0 < args.page_size <= main.BATCH_WRITE_LIMIT:
+        raise SystemExit(f"--page-size must be 1..{main.BATCH_WRITE_LIMIT}")
+    if in_place and not args.backfill:
+        raise SystemExit("copying a collection onto itself only makes sense with --backfill")
+    path  = args.checkpoint or f".copy-{args.source}-{args.target}.json"
+    if args.restart:                            # overwrite whatever copy it was for
+        state = {"source": args.source, "target": args.target, "last": None, "copied": 0}
+    else:
+        state = _load_checkpoint(path, args.source, args.target)
+    if state["last"]:
+        print(f"resuming after {state['last']} ({state['copied']} already copied)")
+
+    query  = db.collection(args.source).order_by("__name__").limit(args.page_size)
+    target = db.collection(args.target)
+    pool   = ThreadPoolExecutor(max_workers=args.workers)
+    inflight: deque = deque()                   # (future, last id, docs) in page order
+    started, done = time.monotonic(), 0
+
+    def settle_oldest():
+        nonlocal done
+        future, last, count = inflight.popleft()
+        future.result()                         # a failed batch stops the copy here
+        state["last"], state["copied"] = last, state["copied"] + count
+        done += count
+        _save_checkpoint(path, state)
+        rate = done / max(time.monotonic() - started, 1e-9)
+        print(f"\r{state['copied']} docs copied, {rate:.0f} docs/s", end="", flush=True)
+
+    try:
+        last = state["last"]
+        while True:
+            page = list((query.start_after({"__name__": last}) if last else query).stream())
+            if not page:
+                break
+            batch = db.batch()
+            for doc in page:
+                data = doc.to_dict() or {}
+                extra = main.backfill_operation_doc(data) if args.backfill else {}
+                if in_place:
+                    if extra:
+                        batch.set(doc.reference, extra, merge=True)
+                else:
+                    batch.set(target.document(doc.id), {**data, **extra})
+            last = page[-1].id
+            commit = batch.commit if len(batch) else (lambda: None)  # in place: nothing missing
+            inflight.append((pool.submit(commit), last, len(page)))
+            while inflight and (len(inflight) >= 2 * args.workers or inflight[0][0].done()):
+                settle_oldest()                 # bounds memory to 2 × workers pages
+        while inflight:
+            settle_oldest()
+    finally:
+        pool.shutdown(cancel_futures=True)
+    print(f"\ncopied {state['copied']} docs {args.source} → {args.target}")
+    if os.path.exists(path):
+        os.remove(path)                         # finished; next run starts over
+
+
+def build_parser() -> argparse.ArgumentParser:
+    p   = argparse.ArgumentParser(description=__doc__,
+                                  formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = p.add_subparsers(dest="cmd", required=True)
+
+    r = sub.add_parser("refresh", help="refresh RUNNING operations with backoff")
+    r.add_argument("--once", action="store_true", help="run one pass and exit")
+    r.add_argument("--interval", type=float, default=main.REFRESH_INTERVAL,
+                   help="seconds between passes (default: %(default)s)")
+    r.set_defaults(func=cmd_refresh)
+
+    b = sub.add_parser("backfill-parent", help="store the tenant on existing operations")
+    b.add_argument("--page-size", type=int, default=main.BATCH_WRITE_LIMIT,
+                   help="documents per read page / write batch (default: %(default)s)")
+    b.add_argument("--dry-run", action="store_true", help="count, don't write")
+    b.set_defaults(func=cmd_backfill_parent)
+
+    c = sub.add_parser("copy", help="copy a collection, resumable (replaces migration.js)")
+    c.add_argument("source")
+    c.add_argument("target")
+    c.add_argument("--backfill", action="store_true",
+                   help="add the fields save_operation() writes today to older documents")
+    c.add_argument("--page-size", type=int, default=main.BATCH_WRITE_LIMIT,
+                   help="documents per read page / commit, max 500 (default: %(default)s)")
+    c.add_argument("--workers", type=int, default=4, help="parallel batch commits")
+    c.add_argument("--checkpoint", help="cursor file (default: .copy-SOURCE-TARGET.json)")
+    c.add_argument("--restart", action="store_true", help="ignore an existing checkpoint")
+    c.set_defaults(func=cmd_copy)
+
+    a = sub.add_parser("archive", help="move settled operations out of the hot collection")
+    a.add_argument("--days", type=float, default=main.ARCHIVE_AFTER_DAYS,
+                   help="archive when SUCCEEDED / CLOSED for longer than this (default: %(default)s)")
+    a.add_argument("--dry-run", action="store_true", help="count, don't move")
+    a.set_defaults(func=cmd_archive)
+    return p
+
+
+if __name__ == "__main__":
+    args = build_parser().parse_args()
+    args.func(args)
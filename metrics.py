@@ -0,0 +1,188 @@
+# metrics.py — minimal in-process Prometheus metrics (text format 0.0.4)
+#
+# Each gunicorn worker keeps its own numbers; every update is one lock and a
+# few dict operations, so it is fine to leave on in production. After share(),
+# every worker also writes its numbers to a file in a shared directory and
+# render() sums the files of all live workers, so any worker answers a
+# scrape for the whole server.
+import json
+import os
+import threading
+import time
+
+DEFAULT_BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30)
+
+_registry = []
+_shared   = None                # directory of the per-worker files, see share()
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _fmt_labels(names: tuple, values: tuple, le: str | None = None) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if le is not None:
+        pairs.append(f'le="{le}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self._values = {}
+        self._lock   = threading.Lock()
+        _registry.append(self)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(self._values)
+
+    def merge(self, a, b):
+        return a + b
+
+    def render(self, values: dict | None = None) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        items = (self.snapshot() if values is None else values).items()
+        for key, value in sorted(items):
+            lines.append(f"{self.name}{_fmt_labels(self.labels, key)} {value}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount: float = 1):
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: tuple = (),
+                 buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *labels):
+        with self._lock:
+            counts, total, n = self._values.get(labels) or ([0] * len(self.buckets), 0.0, 0)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[labels] = (counts, total + value, n + 1)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {k: (list(v[0]), v[1], v[2]) for k, v in self._values.items()}
+
+    def merge(self, a, b):
+        return [x + y for x, y in zip(a[0], b[0])], a[1] + b[1], a[2] + b[2]
+
+    def render(self, values: dict | None = None) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        items = (self.snapshot() if values is None else values).items()
+        for key, (counts, total, n) in sorted(items):
+            for bound, c in zip(self.buckets, counts):
+                lines.append(f"{self.name}_bucket{_fmt_labels(self.labels, key, bound)} {c}")
+            lines.append(f"{self.name}_bucket{_fmt_labels(self.labels, key, '+Inf')} {n}")
+            lines.append(f"{self.name}_sum{_fmt_labels(self.labels, key)} {total}")
+            lines.append(f"{self.name}_count{_fmt_labels(self.labels, key)} {n}")
+        return lines
+
+
+def _dump():
+    """Write this process' values to its file in the shared directory."""
+    path = os.path.join(_shared, f"{os.getpid()}.json")
+    data = {m.name: [[list(k), v] for k, v in m.snapshot().items()] for m in _registry}
+    with open(path + ".tmp", "w") as f:
+        json.dump(data, f)
+    os.replace(path + ".tmp", path)             # readers never see half a file
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def share(directory: str, interval: float = 5.0) -> threading.Thread:
+    """
+    Publish this process' values to |directory| every |interval| seconds so
+    that render() in any process sharing it reports the sum over all of
+    them. Call once per worker, after the fork.
+    """
+    global _shared
+    os.makedirs(directory, exist_ok=True)
+    _shared = directory
+
+    def loop():
+        while True:
+            try:
+                _dump()
+            except OSError:
+                pass                            # try again next round
+            time.sleep(interval)
+
+    t = threading.Thread(target=loop, name="metrics-share", daemon=True)
+    t.start()
+    return t
+
+
+def _collect() -> dict:
+    """{metric name: {labels: value}} summed over every live worker."""
+    totals = {m.name: m.snapshot() for m in _registry}
+    if _shared is None:
+        return totals
+    by_name = {m.name: m for m in _registry}
+    for entry in os.scandir(_shared):
+        pid = entry.name.removesuffix(".json")
+        if not entry.name.endswith(".json") or not pid.isdigit() or int(pid) == os.getpid():
+            continue
+        if not _alive(int(pid)):                # its gauges mean nothing any more
+            try:
+                os.unlink(entry.path)
+            except OSError:
+                pass
+            continue
+        try:
+            with open(entry.path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        for name, rows in data.items():
+            metric = by_name.get(name)
+            if metric is None:
+                continue
+            values = totals[name]
+            for labels, value in rows:
+                key = tuple(labels)
+                values[key] = metric.merge(values[key], value) if key in values else value
+    return totals
+
+
+def render() -> str:
+    """Every registered metric in Prometheus text exposition format."""
+    totals = _collect()
+    lines  = []
+    for metric in _registry:
+        lines.extend(metric.render(totals[metric.name]))
+    return "\n".join(lines) + "\n"